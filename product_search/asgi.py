@@ -2,6 +2,11 @@
 ASGI config for product_search project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server, e.g. ``uvicorn product_search.asgi:application``,
+to run async views such as ``ProductSearchAsyncView`` (``/api/products/async/``).
+Their database queries, ratelimit checks and Redis calls still run in
+``sync_to_async`` threads (Django's ORM and django-redis have no native async
+I/O), so each request takes several thread hops.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,5 +17,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'product_search.settings')
+# Persistent connections are disabled, as Django recommends in async mode:
+# async views query from sync_to_async threads, where a connection kept
+# open isn't reliably reused or closed. Set before the settings read .env,
+# so only a value exported in the environment overrides it; DB_POOL=True
+# is the way to reuse connections here
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -29,6 +29,9 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    # Trigram lookups (trigram_similar, trigram_word_similar) and the
+    # OpClass index expressions used by the products app
+    'django.contrib.postgres',
 ]
 
 THIRD_PARTY_APPS = [
@@ -62,6 +65,7 @@ INSTALLED_APPS = INSTALLED_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'products.routers.replica_pinning_middleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -101,13 +105,54 @@ DATABASES = {
         'PASSWORD': env('DB_PASSWORD'),
         'HOST': env('DB_HOST'),
         'PORT': env('DB_PORT'),
+        # Keep connections open between requests and check them before reuse;
+        # product_search.asgi defaults this to 0, see the README
+        'CONN_MAX_AGE': env.int('DB_CONN_MAX_AGE', default=60),
+        'CONN_HEALTH_CHECKS': env.bool('DB_CONN_HEALTH_CHECKS', default=True),
+        'OPTIONS': {},
     }
 }
 
+# Read replicas, as database URLs; they become the aliases replica1,
+# replica2, ... that products.routers.ReplicaRouter sends reads to. A
+# second URL for the primary itself works as a replica without lag
+for index, url in enumerate(env.list('DB_REPLICA_URLS', default=[]), 1):
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        **env.db_url_config(url),
+        'OPTIONS': {},
+        # Tests read the test database through the replica aliases
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# psycopg 3 connection pool (Django 5.1+); it replaces persistent
+# connections, which must then be disabled. Each alias gets its own pool
+if env.bool('DB_POOL', default=False):
+    for database in DATABASES.values():
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS']['pool'] = {
+            'min_size': env.int('DB_POOL_MIN_SIZE', default=2),
+            'max_size': env.int('DB_POOL_MAX_SIZE', default=10),
+            'timeout': env.int('DB_POOL_TIMEOUT', default=10),
+        }
+
+DATABASE_ROUTERS = ['products.routers.ReplicaRouter']
+
+# Reads leave a replica lagging by more than MAX_LAG seconds, as measured
+# every CHECK_INTERVAL seconds, and every worker reads from the primary
+# for MAX_LAG seconds after a catalog change. A client that sent a write
+# reads from the primary for PIN_SECONDS
+PRODUCT_DB_REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias != 'default'],
+    'MAX_LAG': env.float('DB_REPLICA_MAX_LAG', default=2.0),
+    'CHECK_INTERVAL': env.float('DB_REPLICA_CHECK_INTERVAL', default=5.0),
+    'PIN_SECONDS': env.int('DB_REPLICA_PIN_SECONDS', default=15),
+}
+
 
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'products.pagination.KeysetPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
@@ -116,11 +161,41 @@ REST_FRAMEWORK = {
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
-        "LOCATION": "redis://127.0.0.1:6379/1",
+        "LOCATION": env("REDIS_URL", default="redis://127.0.0.1:6379/1"),
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "SOCKET_CONNECT_TIMEOUT": env.float(
+                "REDIS_CONNECT_TIMEOUT", default=2.0
+            ),
+            "SOCKET_TIMEOUT": env.float("REDIS_TIMEOUT", default=2.0),
+            # One pool per process, shared by every request
+            "CONNECTION_POOL_KWARGS": {
+                "max_connections": env.int("REDIS_MAX_CONNECTIONS", default=50),
+                "retry_on_timeout": True,
+                "health_check_interval": 30,
+            },
         }
-    }
+    },
+    # Rate-limit counters live in their own Redis database so they neither
+    # compete with nor get evicted alongside cached search results
+    "ratelimit": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": env(
+            "REDIS_RATELIMIT_URL", default="redis://127.0.0.1:6379/2"
+        ),
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "SOCKET_CONNECT_TIMEOUT": env.float(
+                "REDIS_CONNECT_TIMEOUT", default=2.0
+            ),
+            "SOCKET_TIMEOUT": env.float("REDIS_TIMEOUT", default=2.0),
+            "CONNECTION_POOL_KWARGS": {
+                "max_connections": env.int("REDIS_MAX_CONNECTIONS", default=50),
+                "retry_on_timeout": True,
+                "health_check_interval": 30,
+            },
+        }
+    },
 }
 
 
@@ -166,5 +241,188 @@ STATIC_ROOT = BASE_DIR / 'static'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-RATELIMIT_USE_CACHE = 'default'  # Uses Redis
-RATELIMIT_ENABLE = True
\ No newline at end of file
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'products.search.slow': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'products.search.index': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'products.db.replicas': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+RATELIMIT_USE_CACHE = 'ratelimit'  # Uses Redis
+RATELIMIT_ENABLE = True
+
+# Per-endpoint limits checked by products.ratelimit. LocalRateLimiter (the
+# default) counts in process and syncs with Redis every SYNC_INTERVAL
+# seconds per client, so cached hits make no Redis call for the check;
+# RedisRateLimiter is exact but costs one pipelined round-trip per request
+PRODUCT_RATELIMIT = {
+    "BACKEND": env(
+        "PRODUCT_RATELIMIT_BACKEND",
+        default="products.ratelimit.LocalRateLimiter",
+    ),
+    "CACHE_ALIAS": "ratelimit",
+    "SYNC_INTERVAL": env.float("PRODUCT_RATELIMIT_SYNC_INTERVAL", default=1.0),
+    "RATES": {
+        "search": env("PRODUCT_RATELIMIT_SEARCH", default="100/hour"),
+        "suggest": env("PRODUCT_RATELIMIT_SUGGEST", default="2000/hour"),
+        # Sized for the tills of a store scanning from behind one NAT
+        # address: about eight lookups a second between them
+        "barcode": env("PRODUCT_RATELIMIT_BARCODE", default="30000/hour"),
+        "barcode_batch": env(
+            "PRODUCT_RATELIMIT_BARCODE_BATCH", default="3000/hour"
+        ),
+    },
+}
+
+
+# Search
+# Maximum number of candidate rows scored by universal_search; 0 scores
+# every row (the original single-phase query)
+PRODUCT_SEARCH_CANDIDATE_LIMIT = env.int(
+    "PRODUCT_SEARCH_CANDIDATE_LIMIT", default=1000
+)
+
+# Serve searches from the trigger-maintained ProductSearchDocument table
+# (one row per product with brand and category names and a pre-rendered
+# payload) instead of joining products to the lookups
+PRODUCT_SEARCH_DOCUMENTS = env.bool("PRODUCT_SEARCH_DOCUMENTS", default=True)
+
+# "memory" ranks ?search= in each worker with the in-memory index of
+# products.memory_index, built from the search documents in a background
+# thread (Postgres answers until it is ready); "postgres" ranks in the
+# database
+PRODUCT_SEARCH_BACKEND = env("PRODUCT_SEARCH_BACKEND", default="postgres")
+
+# The in-memory index checks for changed documents every REFRESH_INTERVAL
+# seconds once the cache generation moved, and is rebuilt when more than
+# MAX_DELTA documents changed since its build or after MAX_AGE seconds.
+# BATCH rows are fetched per round-trip while building
+PRODUCT_SEARCH_MEMORY_INDEX = {
+    "REFRESH_INTERVAL": env.float(
+        "PRODUCT_SEARCH_MEMORY_INDEX_REFRESH_INTERVAL", default=1.0
+    ),
+    "MAX_DELTA": env.int(
+        "PRODUCT_SEARCH_MEMORY_INDEX_MAX_DELTA", default=5000
+    ),
+    "MAX_AGE": env.int(
+        "PRODUCT_SEARCH_MEMORY_INDEX_MAX_AGE", default=60 * 60
+    ),
+    "BATCH": 5000,
+}
+
+# Relevance weights and cutoffs; any entry can be overridden at runtime with
+# a ScoringParameter row (manage.py search_scoring --set NAME=VALUE).
+# static_score is the precomputed popularity/recency signal; with
+# STATIC_CANDIDATES (only honoured once compute_static_scores has run) the
+# candidate limit keeps the highest static scores among the first
+# STATIC_SCAN_FACTOR * PRODUCT_SEARCH_CANDIDATE_LIMIT matches
+PRODUCT_SEARCH_SCORING = {
+    "FULLTEXT_WEIGHT": 0.7,
+    "NAME_WEIGHT": 0.3,
+    "DESCRIPTION_WEIGHT": 0.2,
+    "STATIC_WEIGHT": 0.05,
+    # Minimum scores for a row to match in the single-phase search
+    "FULLTEXT_CUTOFF": 0.1,
+    "NAME_CUTOFF": 0.2,
+    "STATIC_CANDIDATES": False,
+    "STATIC_SCAN_FACTOR": 4,
+}
+
+# Inputs of compute_static_scores: log-scaled popularity and a recency
+# decay halving every RECENCY_HALF_LIFE_DAYS, weighted to sum to 1
+PRODUCT_STATIC_SCORE = {
+    "POPULARITY_WEIGHT": 0.5,
+    "RECENCY_WEIGHT": 0.5,
+    "RECENCY_HALF_LIFE_DAYS": 90,
+}
+
+# Upper bound for ?count=capped on paginated search results
+PRODUCT_SEARCH_COUNT_CAP = env.int("PRODUCT_SEARCH_COUNT_CAP", default=1000)
+
+# Cached search responses are invalidated by bumping a generation counter
+# when products, brands or categories change, so the TTL can be long
+PRODUCT_SEARCH_CACHE_TIMEOUT = env.int(
+    "PRODUCT_SEARCH_CACHE_TIMEOUT", default=60 * 60 * 24
+)
+
+# Search responses are cached as their rendered JSON body; "gzip" stores
+# it compressed and sends it as is to clients accepting gzip, "" stores it
+# uncompressed
+PRODUCT_SEARCH_CACHE_COMPRESSION = env(
+    "PRODUCT_SEARCH_CACHE_COMPRESSION", default="gzip"
+)
+
+# Per-process LRU cache of search responses in front of Redis, bounded by
+# the pickled size of its entries (0 disables it). Workers re-read the
+# cache generation every GENERATION_CHECK_INTERVAL seconds, so edits can
+# take that long to show on a worker
+PRODUCT_SEARCH_LOCAL_CACHE = {
+    "MAX_BYTES": env.int(
+        "PRODUCT_SEARCH_LOCAL_CACHE_BYTES", default=32 * 1024 * 1024
+    ),
+    "TIMEOUT": env.int("PRODUCT_SEARCH_LOCAL_CACHE_TIMEOUT", default=60),
+    "GENERATION_CHECK_INTERVAL": env.float(
+        "PRODUCT_SEARCH_LOCAL_CACHE_CHECK_INTERVAL", default=1.0
+    ),
+}
+
+# Expired entries are still served for this many seconds while a single
+# worker recomputes them (stale-while-revalidate)
+PRODUCT_SEARCH_CACHE_STALE_TIMEOUT = env.int(
+    "PRODUCT_SEARCH_CACHE_STALE_TIMEOUT", default=60 * 5
+)
+# Lifetime of the recompute lock, in seconds
+PRODUCT_SEARCH_CACHE_LOCK_TIMEOUT = env.int(
+    "PRODUCT_SEARCH_CACHE_LOCK_TIMEOUT", default=30
+)
+# How long a worker waits for another worker's result before computing it
+# itself, in seconds
+PRODUCT_SEARCH_CACHE_WAIT = env.float("PRODUCT_SEARCH_CACHE_WAIT", default=2.0)
+
+# Share of search requests whose term is counted in the popular searches
+# sorted set, and how many terms it keeps; warm_search_cache precomputes
+# the top ones. The same share of barcode lookups counts a hit for each
+# product found, added to Product.popularity by compute_static_scores
+PRODUCT_SEARCH_POPULARITY = {
+    "SAMPLE_RATE": env.float(
+        "PRODUCT_SEARCH_POPULARITY_SAMPLE_RATE", default=0.01
+    ),
+    "MAX_TERMS": env.int(
+        "PRODUCT_SEARCH_POPULARITY_MAX_TERMS", default=10000
+    ),
+}
+
+# Searches slower than this many ms (on a cache miss) are logged to
+# products.search.slow with their SQL; 0 disables the log
+PRODUCT_SEARCH_SLOW_MS = env.int("PRODUCT_SEARCH_SLOW_MS", default=500)
+# Include the EXPLAIN plan in slow search records
+PRODUCT_SEARCH_SLOW_EXPLAIN = env.bool(
+    "PRODUCT_SEARCH_SLOW_EXPLAIN", default=False
+)
+
+# Maximum number of barcodes resolved by one batch lookup request
+PRODUCT_BARCODE_BATCH_LIMIT = env.int("PRODUCT_BARCODE_BATCH_LIMIT", default=500)
+
+# Histogram bucket widths for ?facets=1
+PRODUCT_FACET_CALORIES_BUCKET = env.int(
+    "PRODUCT_FACET_CALORIES_BUCKET", default=100
+)
+PRODUCT_FACET_PROTEIN_BUCKET = env.int("PRODUCT_FACET_PROTEIN_BUCKET", default=5)
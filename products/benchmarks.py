@@ -0,0 +1,153 @@
+# products/benchmarks.py
+import json
+import statistics
+import subprocess
+import time
+from contextlib import contextmanager
+
+# Realistic query mix replayed by bench_search, as (kind, weight, terms)
+ENGLISH_TERMS = [
+    "milk", "organic juice", "cheese", "chicken", "water", "natural honey",
+    "rice", "fresh bread", "dates", "olives",
+]
+ARABIC_TERMS = [
+    "حليب", "عصير", "جبن", "دجاج", "ماء", "عسل طبيعي", "رز", "خبز", "تمر",
+    "زيتون",
+]
+TYPO_TERMS = ["melk", "chese", "chiken", "watr", "hony", "yougurt", "bred"]
+PREFIX_TERMS = ["mi", "ch", "wa", "ju", "حل", "عص"]
+
+# Spelling variants that must fold to the same text, as (text, normalized)
+ARABIC_CORPUS = [
+    ("ألبان", "البان"),  # alef with hamza above
+    ("إفطار", "افطار"),  # alef with hamza below
+    ("آيس كريم", "ايس كريم"),  # alef with madda
+    ("معكرونة", "معكرونه"),  # taa marbuta
+    ("مشفى", "مشفي"),  # alef maqsura
+    ("ح\u064eل\u0650يب", "حليب"),  # tashkeel
+    ("حل\u0640\u0640يب", "حليب"),  # tatweel
+    ("\ufea3\ufee0\ufef4\ufe90", "حليب"),  # presentation forms
+    ("  زيت   زيتون ", "زيت زيتون"),  # whitespace
+]
+
+QUERY_MIX = [
+    ("english", 40, ENGLISH_TERMS),
+    ("arabic", 25, ARABIC_TERMS),
+    ("typo", 15, TYPO_TERMS),
+    ("barcode", 10, None),
+    ("prefix", 10, PREFIX_TERMS),
+]
+
+# Plan nodes that read table or index rows
+SCAN_NODES = {
+    "Seq Scan",
+    "Index Scan",
+    "Index Only Scan",
+    "Bitmap Heap Scan",
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summarize(samples):
+    # Milliseconds, rounded so result files diff cleanly
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "p50": round(percentile(samples, 50), 3),
+        "p90": round(percentile(samples, 90), 3),
+        "p99": round(percentile(samples, 99), 3),
+        "mean": round(statistics.mean(samples), 3),
+        "max": round(max(samples), 3),
+    }
+
+
+def format_summary(summary):
+    if not summary["count"]:
+        return "no samples"
+    return (
+        f"p50={summary['p50']:.1f}ms p90={summary['p90']:.1f}ms "
+        f"p99={summary['p99']:.1f}ms"
+    )
+
+
+class StageTimer:
+    """Collects wall-clock samples (in ms) per named stage."""
+
+    def __init__(self):
+        self.samples = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.samples.setdefault(name, []).append(elapsed)
+
+    def summary(self):
+        return {name: summarize(s) for name, s in self.samples.items()}
+
+
+def build_query_mix(rng, count, barcodes):
+    kinds = [kind for kind, _, _ in QUERY_MIX]
+    weights = [weight for _, weight, _ in QUERY_MIX]
+    terms = {kind: terms for kind, _, terms in QUERY_MIX}
+    terms["barcode"] = barcodes
+
+    mix = []
+    for kind in rng.choices(kinds, weights=weights, k=count):
+        if terms[kind]:
+            mix.append((kind, rng.choice(terms[kind])))
+    return mix
+
+
+def plan_stats(queryset):
+    # Runs the query under EXPLAIN (ANALYZE, BUFFERS)
+    plan = json.loads(
+        queryset.explain(analyze=True, buffers=True, format="json")
+    )[0]
+    stats = {
+        "execution_ms": plan.get("Execution Time"),
+        "rows_scanned": 0,
+        "seq_scans": 0,
+        "shared_hit": plan["Plan"].get("Shared Hit Blocks", 0),
+        "shared_read": plan["Plan"].get("Shared Read Blocks", 0),
+    }
+    _walk_plan(plan["Plan"], stats)
+    return stats
+
+
+def _walk_plan(node, stats):
+    if node["Node Type"] in SCAN_NODES:
+        loops = node.get("Actual Loops", 1)
+        read = node.get("Actual Rows", 0) + node.get("Rows Removed by Filter", 0)
+        stats["rows_scanned"] += read * loops
+        if node["Node Type"] == "Seq Scan":
+            stats["seq_scans"] += 1
+    for child in node.get("Plans", []):
+        _walk_plan(child, stats)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, results):
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(results, fh, indent=2, sort_keys=True, ensure_ascii=False)
+        fh.write("\n")
@@ -0,0 +1,174 @@
+# products/cache.py
+import asyncio
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .normalization import normalize_search_term
+from .routers import replicas
+
+SEARCH_GENERATION_KEY = "product_search:generation"
+
+# Query parameters holding free text that the filters normalize
+TEXT_PARAMS = {"search", "fulltext"}
+
+
+def get_search_generation():
+    generation = cache.get(SEARCH_GENERATION_KEY)
+    if generation is None:
+        cache.add(SEARCH_GENERATION_KEY, _initial_generation(), timeout=None)
+        generation = cache.get(SEARCH_GENERATION_KEY)
+    # Responses cached under a new generation are computed on the primary
+    replicas.observe_generation(generation)
+    return generation
+
+
+async def aget_search_generation():
+    generation = await cache.aget(SEARCH_GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(
+            SEARCH_GENERATION_KEY, _initial_generation(), timeout=None
+        )
+        generation = await cache.aget(SEARCH_GENERATION_KEY)
+    replicas.observe_generation(generation)
+    return generation
+
+
+def bump_search_generation():
+    # Every cached search response is keyed on the generation, so bumping
+    # it invalidates all of them at once; old entries age out by TTL
+    try:
+        return cache.incr(SEARCH_GENERATION_KEY)
+    except ValueError:
+        cache.add(SEARCH_GENERATION_KEY, _initial_generation(), timeout=None)
+        return cache.get(SEARCH_GENERATION_KEY)
+
+
+def canonical_query(params):
+    # Requests that produce the same results map to the same string:
+    # parameters sorted, empty values dropped, free text normalized
+    items = []
+    for key in sorted(params.keys()):
+        values = []
+        for value in params.getlist(key):
+            if key in TEXT_PARAMS:
+                value = normalize_search_term(value)
+            else:
+                value = value.strip()
+            if value:
+                values.append(value)
+        items.extend((key, value) for value in sorted(values))
+    return urlencode(items)
+
+
+def search_cache_key(generation, request):
+    # Entries hold the rendered response body (products.rendering), whose
+    # next/first links are absolute: the scheme, host and path the request
+    # came in on are part of the key, not only the canonical query
+    base_url = request.build_absolute_uri(request.path)
+    query = canonical_query(request.GET)
+    digest = hashlib.sha256(f"{base_url}?{query}".encode()).hexdigest()
+    return f"product_search_body:{generation}:{digest[:32]}"
+
+
+def barcode_cache_key(generation, barcode):
+    return f"product_barcode:{generation}:{barcode}"
+
+
+def suggest_cache_key(generation, prefix, limit):
+    digest = hashlib.sha256(prefix.encode()).hexdigest()
+    return f"product_suggest:{generation}:{limit}:{digest[:32]}"
+
+
+def get_or_compute(key, compute, timeout):
+    """
+    Single-flight read-through cache. Only the worker holding the lock
+    recomputes a missing or expired entry; the others serve the stale value
+    while it revalidates, or wait briefly for it when there is none.
+    """
+    envelope = cache.get(key)
+    if envelope is not None and envelope["fresh_until"] > time.time():
+        return envelope["value"]
+
+    lock_key = f"{key}:lock"
+    lock_timeout = settings.PRODUCT_SEARCH_CACHE_LOCK_TIMEOUT
+    if cache.add(lock_key, 1, timeout=lock_timeout):
+        try:
+            return _compute_and_store(key, compute, timeout)
+        finally:
+            cache.delete(lock_key)
+
+    if envelope is not None:
+        return envelope["value"]
+
+    deadline = time.monotonic() + settings.PRODUCT_SEARCH_CACHE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        envelope = cache.get(key)
+        if envelope is not None:
+            return envelope["value"]
+
+    # The lock holder is too slow or died; don't keep the client waiting
+    return _compute_and_store(key, compute, timeout)
+
+
+def _compute_and_store(key, compute, timeout):
+    value = compute()
+    cache.set(key, _envelope(value, timeout), timeout=_stored_timeout(timeout))
+    return value
+
+
+async def aget_or_compute(key, compute, timeout):
+    """
+    Async variant of get_or_compute for async views; compute is a
+    coroutine function.
+    """
+    envelope = await cache.aget(key)
+    if envelope is not None and envelope["fresh_until"] > time.time():
+        return envelope["value"]
+
+    lock_key = f"{key}:lock"
+    lock_timeout = settings.PRODUCT_SEARCH_CACHE_LOCK_TIMEOUT
+    if await cache.aadd(lock_key, 1, timeout=lock_timeout):
+        try:
+            return await _acompute_and_store(key, compute, timeout)
+        finally:
+            await cache.adelete(lock_key)
+
+    if envelope is not None:
+        return envelope["value"]
+
+    deadline = time.monotonic() + settings.PRODUCT_SEARCH_CACHE_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        envelope = await cache.aget(key)
+        if envelope is not None:
+            return envelope["value"]
+
+    return await _acompute_and_store(key, compute, timeout)
+
+
+async def _acompute_and_store(key, compute, timeout):
+    value = await compute()
+    await cache.aset(
+        key, _envelope(value, timeout), timeout=_stored_timeout(timeout)
+    )
+    return value
+
+
+def _envelope(value, timeout):
+    return {"value": value, "fresh_until": time.time() + timeout}
+
+
+def _stored_timeout(timeout):
+    # Entries outlive their freshness by the stale window
+    return timeout + settings.PRODUCT_SEARCH_CACHE_STALE_TIMEOUT
+
+
+def _initial_generation():
+    # Seeded from the clock so a lost generation key never restarts at a
+    # value that older cached entries were written under
+    return int(time.time() * 1000)
@@ -0,0 +1,102 @@
+# products/facets.py
+from django.conf import settings
+from django.db import connections
+
+FACETS_QUERY = """
+SELECT
+    brand_id,
+    category_id,
+    calories_bucket,
+    protein_bucket,
+    GROUPING(brand_id),
+    GROUPING(category_id),
+    GROUPING(calories_bucket),
+    GROUPING(protein_bucket),
+    COUNT(*)
+FROM (
+    SELECT
+        brand_id,
+        category_id,
+        FLOOR(calories / %s)::integer AS calories_bucket,
+        FLOOR(protein / %s)::integer AS protein_bucket
+    FROM {table}
+    WHERE id IN ({ids})
+) AS matches
+GROUP BY GROUPING SETS (
+    (brand_id), (category_id), (calories_bucket), (protein_bucket)
+)
+"""
+
+
+def wants_facets(params):
+    # Facets describe the whole result set, so only the first page carries
+    # (and caches) them
+    if params.get("cursor"):
+        return False
+    return params.get("facets", "").lower() in {"1", "true", "yes"}
+
+
+def facets_approximate(params, facets):
+    # ?search= ranks at most PRODUCT_SEARCH_CANDIDATE_LIMIT candidates: once
+    # that many matched, the counts cover the candidates, not every match.
+    # Every row is in one brand bucket (NULL included), so they add up to
+    # the rows counted
+    limit = settings.PRODUCT_SEARCH_CANDIDATE_LIMIT
+    if not limit or not params.get("search"):
+        return False
+    return sum(entry["count"] for entry in facets["brand"]) >= limit
+
+
+def compute_facets(queryset, brands, categories):
+    """
+    Counts per brand and per category plus calorie/protein histograms for
+    the rows matched by queryset, from a single GROUPING SETS query on the
+    queryset's own table (products or search documents).
+    """
+    calories_width = settings.PRODUCT_FACET_CALORIES_BUCKET
+    protein_width = settings.PRODUCT_FACET_PROTEIN_BUCKET
+
+    ids_sql, ids_params = (
+        queryset.order_by().values("id").query.sql_with_params()
+    )
+    sql = FACETS_QUERY.format(table=queryset.model._meta.db_table, ids=ids_sql)
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, [calories_width, protein_width, *ids_params])
+        rows = cursor.fetchall()
+
+    facets = {"brand": [], "category": [], "calories": [], "protein": []}
+    for (
+        brand_id, category_id, calories, protein,
+        no_brand, no_category, no_calories, no_protein, count,
+    ) in rows:
+        if not no_brand:
+            facets["brand"].append(_entry(brands, brand_id, count))
+        elif not no_category:
+            facets["category"].append(_entry(categories, category_id, count))
+        elif not no_calories:
+            facets["calories"].append(_bucket(calories, calories_width, count))
+        elif not no_protein:
+            facets["protein"].append(_bucket(protein, protein_width, count))
+
+    facets["brand"].sort(key=lambda entry: -entry["count"])
+    facets["category"].sort(key=lambda entry: -entry["count"])
+    for histogram in (facets["calories"], facets["protein"]):
+        histogram.sort(key=lambda entry: (entry["min"] is None, entry["min"]))
+    return facets
+
+
+def _entry(lookup, pk, count):
+    related = lookup.get(pk)
+    return {
+        "id": pk,
+        "name_en": related["name_en"] if related else None,
+        "name_ar": related["name_ar"] if related else None,
+        "count": count,
+    }
+
+
+def _bucket(index, width, count):
+    # NULL calories/protein end up in a bucket without bounds
+    if index is None:
+        return {"min": None, "max": None, "count": count}
+    return {"min": index * width, "max": (index + 1) * width, "count": count}
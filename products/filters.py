@@ -1,55 +1,159 @@
-from django.contrib.postgres.search import (
-    SearchQuery,
-    SearchRank,
-    SearchVector,
-    TrigramSimilarity,
-)
-from django.db.models import F, Q
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery
+from django.db.models import Q
 from django_filters import rest_framework as filters
 
-from .models import Product
+from .memory_index import search_index
+from .models import Product, ProductSearchDocument
+from .normalization import normalize_search_term
+from .scoring import current_scoring
+from .search import (
+    SEARCH_CONFIG,
+    candidate_search,
+    document_search,
+    is_barcode,
+    legacy_search,
+    ranked_ids,
+    stored_rank,
+)
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
 
 
 class ProductSearchFilter(filters.FilterSet):
+    # Declared before the search filters, which run last and so retrieve
+    # candidates from the already narrowed queryset
+    brand = NumberInFilter(field_name="brand_id", label="Brand ids")
+    category = NumberInFilter(field_name="category_id", label="Category ids")
+    calories = filters.RangeFilter(label="Calories")
+    protein = filters.RangeFilter(label="Protein")
     search = filters.CharFilter(method="universal_search", label="Search")
+    fulltext = filters.CharFilter(
+        method="fulltext_search", label="Full-text search"
+    )
 
     class Meta:
         model = Product
-        fields = ["search"]
+        fields = [
+            "brand",
+            "category",
+            "calories",
+            "protein",
+            "search",
+            "fulltext",
+        ]
 
     def universal_search(self, queryset, name, value):
+        # Same normalization as the cache key, so equal keys mean equal
+        # results
+        value = normalize_search_term(value)
         if not value or len(value) < 2:
             return queryset.none()
 
-        # Create search vectors using only existing fields
-        vector_en = SearchVector("name_en", weight="A") + SearchVector(
-            "description_en", weight="B"
-        )
-        vector_ar = SearchVector("name_ar", weight="A") + SearchVector(
-            "description_ar", weight="B"
-        )
+        # Scanners send bare codes; barcode is unique, so skip ranking and
+        # answer with a single index lookup
+        if is_barcode(value):
+            return queryset.filter(barcode=value)
+
+        scoring = current_scoring()
+        limit = settings.PRODUCT_SEARCH_CANDIDATE_LIMIT
+        if limit:
+            return candidate_search(queryset, value, limit, scoring)
+
+        return legacy_search(queryset, value, scoring)
+
+    def fulltext_search(self, queryset, name, value):
+        value = normalize_search_term(value)
+        if not value or len(value) < 2:
+            return queryset.none()
 
-        search_query = SearchQuery(value, config="simple")
+        search_query = SearchQuery(value, config=SEARCH_CONFIG)
 
-        queryset = queryset.annotate(
-            ft_rank_en=SearchRank(vector_en, search_query),
-            ft_rank_ar=SearchRank(vector_ar, search_query),
-            fuzzy_name_en=TrigramSimilarity("name_en", value),
-            fuzzy_name_ar=TrigramSimilarity("name_ar", value),
-            fuzzy_desc_en=TrigramSimilarity("description_en", value),
-            fuzzy_desc_ar=TrigramSimilarity("description_ar", value),
+        # "@@" on the stored columns is answered by their GIN indexes
+        return queryset.filter(
+            Q(search_vector_en=search_query)
+            | Q(search_vector_ar=search_query)
+        ).annotate(
             relevance=(
-                (F("ft_rank_en") + F("ft_rank_ar")) * 0.7
-                + (F("fuzzy_name_en") + F("fuzzy_name_ar")) * 0.3
-                + (F("fuzzy_desc_en") + F("fuzzy_desc_ar")) * 0.2
+                stored_rank("search_vector_en", search_query)
+                + stored_rank("search_vector_ar", search_query)
             ),
+        ).order_by("-relevance")
+
+
+class ProductDocumentFilter(ProductSearchFilter):
+    """
+    ProductSearchFilter over ProductSearchDocument, which carries the same
+    filter columns, so search is a single-table query.
+    """
+
+    class Meta(ProductSearchFilter.Meta):
+        model = ProductSearchDocument
+
+    def universal_search(self, queryset, name, value):
+        value = normalize_search_term(value)
+        if not value or len(value) < 2:
+            return queryset.none()
+
+        if is_barcode(value):
+            return queryset.filter(barcode=value)
+
+        return document_search(
+            queryset,
+            value,
+            settings.PRODUCT_SEARCH_CANDIDATE_LIMIT,
+            current_scoring(),
         )
 
-        return queryset.filter(
-            Q(ft_rank_en__gt=0.1)
-            | Q(ft_rank_ar__gt=0.1)
-            | Q(fuzzy_name_en__gt=0.2)
-            | Q(fuzzy_name_ar__gt=0.2)
-            | Q(name_en__icontains=value)  # Fallback partial match
-            | Q(name_ar__icontains=value)  # Fallback partial match
+    def fulltext_search(self, queryset, name, value):
+        value = normalize_search_term(value)
+        if not value or len(value) < 2:
+            return queryset.none()
+
+        search_query = SearchQuery(value, config=SEARCH_CONFIG)
+        return queryset.filter(document=search_query).annotate(
+            relevance=stored_rank("document", search_query),
         ).order_by("-relevance")
+
+
+class MemoryIndexFilter(ProductDocumentFilter):
+    """
+    ProductDocumentFilter ranking ?search= with this process's in-memory
+    index; the database only returns the rows of the ranked ids.
+    """
+
+    def universal_search(self, queryset, name, value):
+        value = normalize_search_term(value)
+        if not value or len(value) < 2:
+            return queryset.none()
+
+        if is_barcode(value):
+            return queryset.filter(barcode=value)
+
+        index = search_index.get()
+        if index is None:
+            # Answered by Postgres until the first build finishes
+            return super().universal_search(queryset, name, value)
+
+        # The other filters narrow the index's candidates too, so the
+        # candidate limit applies to the filtered matches as in Postgres
+        ids, relevance = index.search(
+            value,
+            current_scoring(),
+            settings.PRODUCT_SEARCH_CANDIDATE_LIMIT,
+            self.form.cleaned_data,
+        )
+        if not len(ids):
+            return queryset.none()
+        return ranked_ids(queryset, ids.tolist(), relevance.tolist())
+
+
+def search_filterset():
+    """The FilterSet (and so the table) that serves product searches."""
+    if settings.PRODUCT_SEARCH_BACKEND == "memory":
+        return MemoryIndexFilter
+    if settings.PRODUCT_SEARCH_DOCUMENTS:
+        return ProductDocumentFilter
+    return ProductSearchFilter
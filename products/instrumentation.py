@@ -0,0 +1,226 @@
+# products/instrumentation.py
+"""
+Stage timings for the search endpoints: a Server-Timing header on every
+response, per-process histograms exposed in the Prometheus text format and
+a log record for searches slower than PRODUCT_SEARCH_SLOW_MS.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+
+from .normalization import normalize_search_term
+
+logger = logging.getLogger("products.search.slow")
+
+# Histogram upper bounds, in seconds
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0,
+)
+
+
+class RequestTiming:
+    """
+    Wall-clock time per stage of one request, in ms. Stages may nest; each
+    one is charged only the time not spent in its nested stages, so the
+    stages add up to the request's total.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.nested = []
+        self.cache = None
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        self.nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            own = elapsed - self.nested.pop()
+            self.stages[name] = self.stages.get(name, 0.0) + own
+            if self.nested:
+                self.nested[-1] += elapsed
+
+    def total(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def header(self):
+        parts = []
+        for name, ms in self.stages.items():
+            desc = f';desc="{self.cache}"' if name == "cache" else ""
+            parts.append(f"{name}{desc};dur={ms:.1f}")
+        parts.append(f"total;dur={self.total():.1f}")
+        return ", ".join(parts)
+
+
+def timing_for(request):
+    # Stored on the Django request so the ratelimit decorator, which runs
+    # before DRF wraps it, and the view share one RequestTiming
+    request = getattr(request, "_request", request)
+    timing = getattr(request, "search_timing", None)
+    if timing is None:
+        timing = request.search_timing = RequestTiming()
+    return timing
+
+
+class Histogram:
+    def __init__(self, name, description, label):
+        self.name = name
+        self.description = description
+        self.label = label
+        # label value -> ([count per bucket], sum, count)
+        self.series = {}
+
+    def observe(self, value, seconds):
+        buckets, total, count = self.series.get(
+            value, ([0] * len(BUCKETS), 0.0, 0)
+        )
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                buckets[index] += 1
+        self.series[value] = (buckets, total + seconds, count + 1)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for value, (buckets, total, count) in sorted(self.series.items()):
+            label = f'{self.label}="{value}"'
+            for bound, observed in zip(BUCKETS, buckets):
+                lines.append(
+                    f'{self.name}_bucket{{{label},le="{bound}"}} {observed}'
+                )
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label}}} {total}")
+            lines.append(f"{self.name}_count{{{label}}} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, description, label):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.series = {}
+
+    def inc(self, value):
+        self.series[value] = self.series.get(value, 0) + 1
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} counter",
+        ]
+        for value, count in sorted(self.series.items()):
+            lines.append(f'{self.name}{{{self.label}="{value}"}} {count}')
+        return lines
+
+
+class SearchMetrics:
+    """Per-process aggregates; each worker exposes its own."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = Histogram(
+            "product_search_stage_seconds",
+            "Time spent in each stage of a search request.",
+            "stage",
+        )
+        self.requests = Histogram(
+            "product_search_request_seconds",
+            "Total time of search requests by cache result.",
+            "cache",
+        )
+        # "local": answered by the worker's local cache, "hit": by Redis,
+        # "miss": computed
+        self.cache = Counter(
+            "product_search_cache_total",
+            "Search cache lookups by result.",
+            "result",
+        )
+
+    def record(self, timing):
+        with self.lock:
+            for name, ms in timing.stages.items():
+                self.stages.observe(name, ms / 1000)
+            if timing.cache:
+                self.cache.inc(timing.cache)
+            self.requests.observe(timing.cache or "none", timing.total() / 1000)
+
+    def hit_ratios(self):
+        # Share of the lookups reaching each tier that it answered
+        local = self.cache.series.get("local", 0)
+        redis = self.cache.series.get("hit", 0)
+        miss = self.cache.series.get("miss", 0)
+        total = local + redis + miss
+        return {
+            "local": local / total if total else 0,
+            "redis": redis / (redis + miss) if redis + miss else 0,
+        }
+
+    def render(self):
+        with self.lock:
+            lines = (
+                self.stages.render()
+                + self.requests.render()
+                + self.cache.render()
+            )
+            ratios = self.hit_ratios()
+        lines += [
+            "# HELP product_search_cache_hit_ratio Share of the lookups "
+            "reaching each cache tier that it answered.",
+            "# TYPE product_search_cache_hit_ratio gauge",
+        ]
+        for tier, ratio in ratios.items():
+            lines.append(
+                f'product_search_cache_hit_ratio{{tier="{tier}"}} {ratio:.4f}'
+            )
+        return "\n".join(lines) + "\n"
+
+
+metrics = SearchMetrics()
+
+
+def finish_timing(request, response):
+    timing = timing_for(request)
+    response["Server-Timing"] = timing.header()
+    metrics.record(timing)
+    return response
+
+
+def is_slow(elapsed_ms):
+    threshold = settings.PRODUCT_SEARCH_SLOW_MS
+    return bool(threshold) and elapsed_ms >= threshold
+
+
+def log_slow_search(params, queryset, elapsed_ms):
+    term = normalize_search_term(
+        params.get("search") or params.get("fulltext") or ""
+    )
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        sql = None
+
+    record = {"term": term, "elapsed_ms": round(elapsed_ms, 1), "sql": sql}
+    # Plain EXPLAIN only plans the query; it doesn't run it a second time
+    if settings.PRODUCT_SEARCH_SLOW_EXPLAIN and sql is not None:
+        record["explain"] = queryset.explain()
+
+    logger.warning(
+        "Slow search %r took %.0fms\n%s%s",
+        term,
+        elapsed_ms,
+        sql,
+        f"\n{record['explain']}" if "explain" in record else "",
+        extra={"search": record},
+    )
@@ -0,0 +1,119 @@
+# products/local_cache.py
+"""
+Per-process cache in front of Redis for search responses. Popular queries
+are answered from worker memory without a network round-trip or unpickling.
+
+Entries are keyed like the Redis ones, so they carry the search cache
+generation. Workers read the generation from Redis at most every
+GENERATION_CHECK_INTERVAL seconds; a bump made by any worker is noticed at
+the next check, which also drops the local entries of the old generation.
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .cache import aget_search_generation, get_search_generation
+
+
+class LocalCache:
+    """
+    Thread-safe LRU cache bounded by the pickled size of its values, with a
+    TTL per entry.
+    """
+
+    def __init__(self, max_bytes, timeout):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        # key -> (value, size, expires_at)
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= time.monotonic():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        if not self.max_bytes:
+            return
+        # Same measure as the bytes Redis holds for the value
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, size, time.monotonic() + self.timeout)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
+
+    def render_metrics(self):
+        with self.lock:
+            entries, size = len(self.entries), self.size
+        return [
+            "# HELP product_search_local_cache_entries Responses held in "
+            "this worker's local cache.",
+            "# TYPE product_search_local_cache_entries gauge",
+            f"product_search_local_cache_entries {entries}",
+            "# HELP product_search_local_cache_bytes Pickled size of the "
+            "responses held in this worker's local cache.",
+            "# TYPE product_search_local_cache_bytes gauge",
+            f"product_search_local_cache_bytes {size}",
+        ]
+
+
+class LocalGeneration:
+    """The search cache generation, re-read from Redis at an interval."""
+
+    def __init__(self, interval, local_cache):
+        self.interval = interval
+        self.local_cache = local_cache
+        self.value = None
+        self.checked_at = float("-inf")
+
+    def get(self):
+        if time.monotonic() - self.checked_at >= self.interval:
+            self.observe(get_search_generation())
+        return self.value
+
+    async def aget(self):
+        if time.monotonic() - self.checked_at >= self.interval:
+            self.observe(await aget_search_generation())
+        return self.value
+
+    def observe(self, generation):
+        if generation != self.value:
+            # Entries of older generations can't be hit any more
+            self.local_cache.clear()
+            self.value = generation
+        self.checked_at = time.monotonic()
+
+
+search_local_cache = LocalCache(
+    settings.PRODUCT_SEARCH_LOCAL_CACHE["MAX_BYTES"],
+    settings.PRODUCT_SEARCH_LOCAL_CACHE["TIMEOUT"],
+)
+local_generation = LocalGeneration(
+    settings.PRODUCT_SEARCH_LOCAL_CACHE["GENERATION_CHECK_INTERVAL"],
+    search_local_cache,
+)
@@ -0,0 +1,728 @@
+# products/management/commands/bench_search.py
+import gzip
+import pickle
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from django_redis import get_redis_connection
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from products.benchmarks import (
+    ARABIC_CORPUS,
+    ARABIC_TERMS,
+    ENGLISH_TERMS,
+    TYPO_TERMS,
+    StageTimer,
+    build_query_mix,
+    format_summary,
+    git_revision,
+    plan_stats,
+    summarize,
+    write_results,
+)
+from products.cache import get_search_generation
+from products.filters import search_filterset
+from products.local_cache import LocalCache
+from products.memory_index import build_index
+from products.models import Product, ProductSearchDocument
+from products.normalization import normalize_search_term
+from products.pagination import KeysetPagination, apply_ordering, is_ranked
+from products.ratelimit import KEY_PREFIX, LocalRateLimiter, RedisRateLimiter
+from products.scoring import current_scoring
+from products.search import (
+    candidate_search,
+    document_search,
+    legacy_search,
+    ranked_ids,
+)
+from products.serializers import (
+    PRODUCT_LIST_FIELDS,
+    ProductListEncoder,
+    ProductSerializer,
+    list_encoder,
+    related_lookup,
+)
+from products.views import ProductAPIView
+
+SECTIONS = [
+    "replay",
+    "compare",
+    "description",
+    "serialization",
+    "concurrency",
+    "connections",
+    "normalization",
+    "ratelimit",
+    "payload",
+    "memory",
+]
+
+BENCH_CACHE_KEY = "bench_search:page"
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a dataset of the requested size and benchmarks the search "
+        "API: replays a realistic query mix with per-stage latency "
+        "percentiles, EXPLAIN (ANALYZE, BUFFERS) statistics and throughput, "
+        "optionally writing the results as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size",
+            type=int,
+            default=100000,
+            help="Products to have in the table, generating the missing "
+            "ones (default: 100000)",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=500,
+            help="Requests replayed from the query mix (default: 500)",
+        )
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=20,
+            help="Page size of replayed requests (default: 20)",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=42,
+            help="Seed for the query mix (default: 42)",
+        )
+        parser.add_argument(
+            "--runs",
+            type=int,
+            default=20,
+            help="Timed runs per query in the comparison sections "
+            "(default: 20)",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=1000,
+            help="Candidate limit for the pipeline (default: 1000)",
+        )
+        parser.add_argument(
+            "--serialize-rows",
+            type=int,
+            default=1000,
+            help="Rows encoded per serialization run (default: 1000)",
+        )
+        parser.add_argument(
+            "--section",
+            action="append",
+            dest="sections",
+            choices=SECTIONS,
+            help="Section to run; repeat for several (default: replay)",
+        )
+        parser.add_argument(
+            "--no-explain",
+            action="store_true",
+            help="Skip EXPLAIN (ANALYZE, BUFFERS) of the replayed queries",
+        )
+        parser.add_argument(
+            "--url",
+            action="append",
+            dest="urls",
+            help="Search endpoint for the concurrency section, e.g. a WSGI "
+            "and an ASGI server; repeat for several",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=50,
+            help="Concurrent clients in the concurrency section (default: 50)",
+        )
+        parser.add_argument(
+            "--output",
+            help="Write the results as JSON to this path",
+        )
+
+    def handle(self, *args, **options):
+        missing = options["size"] - Product.objects.count()
+        if missing > 0:
+            self.stdout.write(f"Generating {missing} products...")
+            call_command("generate_fake_products", count=missing)
+
+        results = {
+            "revision": git_revision(),
+            "timestamp": timezone.now().isoformat(),
+            "size": Product.objects.count(),
+            "options": {
+                key: options[key]
+                for key in ("requests", "page_size", "seed", "runs", "limit")
+            },
+        }
+
+        for section in options["sections"] or ["replay"]:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{section}:"))
+            results[section] = getattr(self, f"bench_{section}")(options)
+
+        if options["output"]:
+            write_results(options["output"], results)
+            self.stdout.write(
+                self.style.SUCCESS(f"Results written to {options['output']}")
+            )
+
+    def bench_replay(self, options):
+        rng = random.Random(options["seed"])
+        barcodes = list(
+            Product.objects.exclude(barcode=None)
+            .order_by("?")
+            .values_list("barcode", flat=True)[:100]
+        )
+        mix = build_query_mix(rng, options["requests"], barcodes)
+
+        factory = APIRequestFactory()
+        filterset_class = search_filterset()
+        model = filterset_class._meta.model
+        encoder = list_encoder(
+            model, *related_lookup.get(get_search_generation())
+        )
+        timer = StageTimer()
+        kinds = {}
+        plans = {}
+
+        started = time.perf_counter()
+        for kind, value in mix:
+            request_started = time.perf_counter()
+            request = Request(factory.get(
+                "/api/products/",
+                {"search": value, "page_size": options["page_size"]},
+                HTTP_HOST="localhost",
+            ))
+
+            # The same stages ProductAPIView runs on a cache miss
+            with timer.stage("sql"):
+                queryset = filterset_class(
+                    request.query_params,
+                    queryset=model.objects.all(),
+                    request=request,
+                ).qs
+                fields = encoder.fields
+                if is_ranked(queryset):
+                    fields += ("relevance",)
+                queryset = queryset.values(*fields)
+                paginator = KeysetPagination()
+                page = paginator.paginate_queryset(queryset, request)
+
+            with timer.stage("serialize"):
+                data = paginator.get_paginated_response(
+                    encoder.encode_many(page)
+                ).data
+
+            with timer.stage("cache"):
+                cache.set(BENCH_CACHE_KEY, data, timeout=60)
+                cache.get(BENCH_CACHE_KEY)
+
+            kinds.setdefault(kind, []).append(
+                (time.perf_counter() - request_started) * 1000
+            )
+
+            if not options["no_explain"] and (kind, value) not in plans:
+                explain_started = time.perf_counter()
+                ordered = apply_ordering(queryset, is_ranked(queryset))
+                plans[kind, value] = plan_stats(
+                    ordered[: options["page_size"] + 1]
+                )
+                # EXPLAIN ANALYZE isn't part of serving the request
+                started += time.perf_counter() - explain_started
+        elapsed = time.perf_counter() - started
+        cache.delete(BENCH_CACHE_KEY)
+
+        result = {
+            "throughput_rps": round(len(mix) / elapsed, 1),
+            "stages": timer.summary(),
+            "kinds": {kind: summarize(s) for kind, s in kinds.items()},
+        }
+        for stage, summary in result["stages"].items():
+            self.stdout.write(f"{stage:>12}: {format_summary(summary)}")
+        for kind, summary in result["kinds"].items():
+            self.stdout.write(f"{kind:>12}: {format_summary(summary)}")
+        self.stdout.write(f"{'throughput':>12}: {result['throughput_rps']} req/s")
+
+        if plans:
+            result["plans"] = {}
+            for kind in kinds:
+                stats = [s for (k, _), s in plans.items() if k == kind]
+                rows = [s["rows_scanned"] for s in stats]
+                result["plans"][kind] = {
+                    "queries": len(stats),
+                    "rows_scanned_max": max(rows),
+                    "rows_scanned_mean": round(sum(rows) / len(rows)),
+                    "seq_scans": sum(s["seq_scans"] for s in stats),
+                    "shared_read": sum(s["shared_read"] for s in stats),
+                    "execution": summarize(
+                        [s["execution_ms"] for s in stats]
+                    ),
+                }
+                self.stdout.write(
+                    f"{kind:>12}: rows scanned max="
+                    f"{result['plans'][kind]['rows_scanned_max']} "
+                    f"seq scans={result['plans'][kind]['seq_scans']}"
+                )
+        return result
+
+    def bench_compare(self, options):
+        # The single-phase query against the candidate pipeline, and the
+        # pipeline against the single-table search documents
+        limit = options["limit"]
+        scoring = current_scoring()
+        products = Product.objects.all()
+        documents = ProductSearchDocument.objects.all()
+        strategies = {
+            "single-phase": (
+                products,
+                lambda qs, value: legacy_search(qs, value, scoring),
+            ),
+            "pipeline": (
+                products,
+                lambda qs, value: candidate_search(qs, value, limit, scoring),
+            ),
+            "documents": (
+                documents,
+                lambda qs, value: document_search(qs, value, limit, scoring),
+            ),
+        }
+
+        result = {}
+        for name, (queryset, search) in strategies.items():
+            samples = []
+            for value in ENGLISH_TERMS:
+                # Warm-up run so plan caching and buffers are comparable
+                list(search(queryset, value)[:20])
+                for _ in range(options["runs"]):
+                    started = time.perf_counter()
+                    list(search(queryset, value)[:20])
+                    samples.append((time.perf_counter() - started) * 1000)
+
+            result[name] = summarize(samples)
+            self.stdout.write(f"{name:>12}: {format_summary(result[name])}")
+        return result
+
+    def bench_description(self, options):
+        # The description signal as it used to be (similarity against the
+        # whole paragraph) and as the pipeline now matches it (%> backed by
+        # the gin_trgm_ops index)
+        matchers = {
+            "similarity": lambda value: Product.objects.annotate(
+                score=TrigramSimilarity("description_en", value)
+            ).filter(score__gt=0.2),
+            "word %>": lambda value: Product.objects.filter(
+                description_en__trigram_word_similar=value
+            ),
+        }
+
+        result = {}
+        for name, match in matchers.items():
+            samples = []
+            full_scans = 0
+            for value in ENGLISH_TERMS:
+                queryset = match(value).values("id")[:1000]
+                if "Seq Scan" in queryset.explain():
+                    full_scans += 1
+                for _ in range(options["runs"]):
+                    started = time.perf_counter()
+                    list(queryset.all())
+                    samples.append((time.perf_counter() - started) * 1000)
+
+            result[name] = dict(summarize(samples), seq_scans=full_scans)
+            self.stdout.write(
+                f"{name:>12}: {format_summary(result[name])} "
+                f"seq scans={full_scans}/{len(ENGLISH_TERMS)}"
+            )
+        return result
+
+    def bench_serialization(self, options):
+        # Encoding only; both sides fetch their rows once up front
+        rows, runs = options["serialize_rows"], options["runs"]
+        instances = list(
+            Product.objects.select_related("brand", "category")[:rows]
+        )
+        values = list(Product.objects.values(*PRODUCT_LIST_FIELDS)[:rows])
+        encoder = ProductListEncoder(
+            *related_lookup.get(get_search_generation())
+        )
+        encoders = {
+            "serializer": lambda: ProductSerializer(instances, many=True).data,
+            "encoder": lambda: encoder.encode_many(values),
+        }
+
+        result = {}
+        for name, encode in encoders.items():
+            started = time.perf_counter()
+            for _ in range(runs):
+                encode()
+            elapsed = time.perf_counter() - started
+            result[name] = {"rows_per_sec": round(len(values) * runs / elapsed)}
+            self.stdout.write(
+                f"{name:>12}: {result[name]['rows_per_sec']:,} rows/sec"
+            )
+        return result
+
+    def bench_concurrency(self, options):
+        # Replays the query mix against running servers with many clients
+        # in flight, e.g. the WSGI /api/products/ and the ASGI
+        # /api/products/async/ endpoints
+        rng = random.Random(options["seed"])
+        mix = build_query_mix(rng, options["requests"], [])
+
+        def fetch(url, value):
+            query = urlencode({"search": value})
+            started = time.perf_counter()
+            try:
+                with urlopen(f"{url}?{query}", timeout=30) as response:
+                    response.read()
+                    outcome = "ok" if response.status == 200 else "error"
+            except HTTPError as exc:
+                outcome = "limited" if exc.code == 403 else "error"
+            except (OSError, HTTPException):
+                # URLError, socket timeouts and resets are OSErrors; a
+                # truncated body is an HTTPException
+                outcome = "error"
+            return (time.perf_counter() - started) * 1000, outcome
+
+        result = {}
+        for url in options["urls"] or []:
+            with ThreadPoolExecutor(options["concurrency"]) as pool:
+                started = time.perf_counter()
+                outcomes = list(pool.map(
+                    lambda query: fetch(url, query[1]), mix
+                ))
+                elapsed = time.perf_counter() - started
+
+            # Latency of the answered searches only: a rate-limited 403
+            # returns before any search work
+            result[url] = dict(
+                summarize([ms for ms, outcome in outcomes if outcome == "ok"]),
+                errors=sum(1 for _, outcome in outcomes if outcome == "error"),
+                rate_limited=sum(
+                    1 for _, outcome in outcomes if outcome == "limited"
+                ),
+                throughput_rps=round(len(outcomes) / elapsed, 1),
+            )
+            self.stdout.write(
+                f"{url}: {format_summary(result[url])} "
+                f"{result[url]['throughput_rps']} req/s "
+                f"errors={result[url]['errors']} "
+                f"rate_limited={result[url]['rate_limited']}"
+            )
+            if result[url]["rate_limited"]:
+                self.stdout.write(self.style.WARNING(
+                    "  Rate-limited requests: run the server with "
+                    "PRODUCT_RATELIMIT_SEARCH raised above --requests per "
+                    "hour, e.g. PRODUCT_RATELIMIT_SEARCH=1000000/hour"
+                ))
+        return result
+
+    def bench_connections(self, options):
+        # Per-request connection overhead: a request that opens a fresh
+        # connection (or checks one out of the pool when DB_POOL is on)
+        # against one that reuses the open connection
+        runs = options["runs"] * 10
+
+        def query():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+
+        def reconnect():
+            connection.close()
+            query()
+
+        result = {}
+        for name, request in {"reconnect": reconnect, "reuse": query}.items():
+            query()
+            samples = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                request()
+                samples.append((time.perf_counter() - started) * 1000)
+            result[name] = summarize(samples)
+            self.stdout.write(f"{name:>12}: {format_summary(result[name])}")
+
+        # Redis round-trip over the pooled client connection
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            cache.get(BENCH_CACHE_KEY)
+            samples.append((time.perf_counter() - started) * 1000)
+        result["redis"] = summarize(samples)
+        self.stdout.write(f"{'redis':>12}: {format_summary(result['redis'])}")
+
+        # The same response from the per-process cache in front of Redis
+        local = LocalCache(max_bytes=1024 * 1024, timeout=60)
+        local.set(BENCH_CACHE_KEY, {"results": [{"id": 1}] * 20})
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            local.get(BENCH_CACHE_KEY)
+            samples.append((time.perf_counter() - started) * 1000)
+        result["local"] = summarize(samples)
+        self.stdout.write(
+            f"{'local':>12}: p50={result['local']['p50'] * 1000:.1f}us "
+            f"p99={result['local']['p99'] * 1000:.1f}us"
+        )
+        return result
+
+    def bench_normalization(self, options):
+        # Write-time (SQL) and query-time (Python) Arabic normalization
+        # must agree, or variants miss the GIN index
+        result = {"mismatches": []}
+        with connection.cursor() as cursor:
+            for text, expected in ARABIC_CORPUS:
+                cursor.execute("SELECT products_normalize_ar(%s)", [text])
+                stored = cursor.fetchone()[0]
+                queried = normalize_search_term(text)
+                if not stored == queried == expected:
+                    result["mismatches"].append({
+                        "text": text,
+                        "expected": expected,
+                        "sql": stored,
+                        "python": queried,
+                    })
+
+        result["checked"] = len(ARABIC_CORPUS)
+        self.stdout.write(
+            f"{'parity':>12}: {len(ARABIC_CORPUS) - len(result['mismatches'])}"
+            f"/{len(ARABIC_CORPUS)} variants agree"
+        )
+        for mismatch in result["mismatches"]:
+            self.stdout.write(self.style.ERROR(f"  {mismatch}"))
+        return result
+
+    def bench_ratelimit(self, options):
+        # Cost of the limit check alone, one client at a time and with
+        # --concurrency threads hammering a handful of client ids
+        checks = options["runs"] * 100
+        clients = [f"10.0.0.{n}" for n in range(10)]
+        backend_options = dict(
+            settings.PRODUCT_RATELIMIT, RATES={"bench": "1000000000/hour"}
+        )
+        backends = {
+            "redis": RedisRateLimiter(backend_options),
+            "local": LocalRateLimiter(backend_options),
+        }
+
+        def check(n):
+            started = time.perf_counter()
+            limiter.is_limited("bench", clients[n % len(clients)])
+            return (time.perf_counter() - started) * 1000
+
+        result = {}
+        for name, limiter in backends.items():
+            sequential = [check(n) for n in range(checks)]
+            with ThreadPoolExecutor(options["concurrency"]) as pool:
+                started = time.perf_counter()
+                concurrent = list(pool.map(check, range(checks)))
+                elapsed = time.perf_counter() - started
+
+            result[name] = {
+                "sequential": summarize(sequential),
+                "concurrent": dict(
+                    summarize(concurrent),
+                    checks_per_sec=round(checks / elapsed),
+                ),
+            }
+            # Local checks take microseconds, below format_summary's 0.1ms
+            summary = result[name]["sequential"]
+            self.stdout.write(
+                f"{name:>12}: p50={summary['p50'] * 1000:.0f}us "
+                f"p99={summary['p99'] * 1000:.0f}us "
+                f"{result[name]['concurrent']['checks_per_sec']:,} checks/sec "
+                f"with {options['concurrency']} threads"
+            )
+
+        client = get_redis_connection(backend_options["CACHE_ALIAS"])
+        for key in client.scan_iter(f"{KEY_PREFIX}:bench:*"):
+            client.delete(key)
+        return result
+
+    def bench_payload(self, options):
+        # Bytes stored per cached page (pickled, as django-redis stores
+        # them) and CPU per cache hit for the previous format, pickled
+        # response data re-rendered by DRF, against the rendered body and
+        # the gzip-compressed body
+        rng = random.Random(options["seed"])
+        mix = build_query_mix(rng, min(options["requests"], 100), [])
+        factory = APIRequestFactory()
+        generation = get_search_generation()
+
+        pages = []
+        for _, value in mix:
+            request = Request(factory.get(
+                "/api/products/",
+                {"search": value, "page_size": options["page_size"]},
+                HTTP_HOST="localhost",
+            ))
+            view = ProductAPIView(
+                request=request, format_kwarg=None, args=(), kwargs={}
+            )
+            pages.append(view.get_list_data(request, generation))
+
+        renderer = JSONRenderer()
+        formats = {
+            "data": (
+                lambda data: data,
+                lambda stored: renderer.render(stored),
+            ),
+            "body": (
+                lambda data: (renderer.render(data), None),
+                lambda stored: stored[0],
+            ),
+            "gzip": (
+                lambda data: (
+                    gzip.compress(renderer.render(data), 6, mtime=0),
+                    "gzip",
+                ),
+                lambda stored: stored[0],
+            ),
+            # gzip entries sent to a client without Accept-Encoding: gzip
+            "gzip-inflated": (
+                lambda data: (
+                    gzip.compress(renderer.render(data), 6, mtime=0),
+                    "gzip",
+                ),
+                lambda stored: gzip.decompress(stored[0]),
+            ),
+        }
+
+        result = {}
+        for name, (store, serve) in formats.items():
+            entries = [
+                pickle.dumps(store(data), pickle.HIGHEST_PROTOCOL)
+                for data in pages
+            ]
+            started = time.process_time()
+            for _ in range(options["runs"]):
+                for entry in entries:
+                    serve(pickle.loads(entry))
+            cpu = time.process_time() - started
+
+            hits = options["runs"] * len(entries)
+            result[name] = {
+                "bytes_mean": round(sum(map(len, entries)) / len(entries)),
+                "cpu_us_per_hit": round(cpu / hits * 1e6, 1),
+            }
+            self.stdout.write(
+                f"{name:>14}: {result[name]['bytes_mean']:,} bytes/page "
+                f"{result[name]['cpu_us_per_hit']}us CPU/hit"
+            )
+        return result
+
+    def bench_memory(self, options):
+        # The in-memory index against document_search: parity of the first
+        # page (the same ranking up to float rounding, barring ties at the
+        # candidate limit) and latency of ranking alone and with the query
+        # hydrating the page
+        scoring = current_scoring()
+        limit, page_size = options["limit"], options["page_size"]
+        documents = ProductSearchDocument.objects.all()
+
+        started = time.perf_counter()
+        index = build_index()
+        result = {
+            "build_seconds": round(time.perf_counter() - started, 1),
+            "documents": len(index),
+            "bytes": index.nbytes(),
+        }
+        self.stdout.write(
+            f"{'build':>14}: {len(index):,} documents, "
+            f"{index.nbytes() / 1024 / 1024:.1f} MB in "
+            f"{result['build_seconds']}s"
+        )
+
+        def postgres(value):
+            queryset = document_search(documents, value, limit, scoring)
+            return list(
+                apply_ordering(queryset, True)
+                .values_list("id", "relevance")[:page_size]
+            )
+
+        def memory(value):
+            return index.search(value, scoring, limit, {})
+
+        def hydrated(value):
+            ids, relevance = memory(value)
+            if not len(ids):
+                return []
+            queryset = ranked_ids(documents, ids.tolist(), relevance.tolist())
+            return list(
+                apply_ordering(queryset, True)
+                .values_list("id", "payload")[:page_size]
+            )
+
+        terms = [
+            normalize_search_term(value)
+            for value in ENGLISH_TERMS + ARABIC_TERMS + TYPO_TERMS
+        ]
+        overlaps, errors, mismatches = [], [], []
+        for value in terms:
+            expected = postgres(value)
+            ids, relevance = memory(value)
+            found = dict(zip(ids[:page_size].tolist(), relevance.tolist()))
+            expected_ids = [pk for pk, _ in expected]
+            if expected_ids:
+                overlaps.append(
+                    len(found.keys() & set(expected_ids)) / len(expected_ids)
+                )
+            errors += [
+                abs(found[pk] - score) for pk, score in expected if pk in found
+            ]
+            if list(found) != expected_ids:
+                mismatches.append({
+                    "term": value,
+                    "postgres": expected_ids,
+                    "memory": list(found),
+                })
+
+        result["parity"] = {
+            "terms": len(terms),
+            "identical": len(terms) - len(mismatches),
+            "overlap_mean": round(sum(overlaps) / max(len(overlaps), 1), 4),
+            "score_error_max": max(errors, default=0.0),
+            "mismatches": mismatches,
+        }
+        self.stdout.write(
+            f"{'parity':>14}: {result['parity']['identical']}/{len(terms)} "
+            f"identical first pages, mean overlap "
+            f"{result['parity']['overlap_mean']:.2%}, max score error "
+            f"{result['parity']['score_error_max']:.1e}"
+        )
+        for mismatch in mismatches:
+            self.stdout.write(self.style.WARNING(f"  {mismatch}"))
+
+        strategies = {
+            "postgres": postgres,
+            "memory": memory,
+            "memory+fetch": hydrated,
+        }
+        for name, search in strategies.items():
+            samples = []
+            for value in terms:
+                search(value)
+                for _ in range(options["runs"]):
+                    started = time.perf_counter()
+                    search(value)
+                    samples.append((time.perf_counter() - started) * 1000)
+            result[name] = summarize(samples)
+            self.stdout.write(f"{name:>14}: {format_summary(result[name])}")
+        return result
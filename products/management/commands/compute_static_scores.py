@@ -0,0 +1,110 @@
+# products/management/commands/compute_static_scores.py
+import math
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Max, Min
+
+from products.cache import bump_search_generation
+from products.models import Product
+from products.popularity import take_product_hits
+
+# Sampled barcode lookups since the last run, added to the products'
+# popularity
+ADD_HITS = """
+UPDATE {product} AS product
+SET popularity = product.popularity + hits.count
+FROM unnest(%s::bigint[], %s::integer[]) AS hits (id, count)
+WHERE product.id = hits.id
+"""
+
+# Only rows whose rounded score changed are written, so a rerun touches
+# (and refreshes the search documents of) few rows
+UPDATE_SCORES = """
+WITH scores AS (
+    SELECT
+        id,
+        round((
+            %(popularity_scale)s * ln(1 + popularity)
+            + %(recency_weight)s * power(
+                0.5,
+                extract(epoch FROM now() - created_at)
+                / 86400 / %(half_life)s
+            )
+        )::numeric, 4)::double precision AS score
+    FROM {product}
+    WHERE id >= %(start)s AND id < %(end)s
+)
+UPDATE {product} AS product
+SET static_score = scores.score
+FROM scores
+WHERE product.id = scores.id
+    AND product.static_score IS DISTINCT FROM scores.score
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Adds the sampled barcode lookups to the products' popularity and "
+        "recomputes the static_score ranking signal from popularity and "
+        "recency, in id-range batches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=10000,
+            help="Width of each id range (default: 10000)",
+        )
+
+    def handle(self, *args, **options):
+        config = settings.PRODUCT_STATIC_SCORE
+        hits = take_product_hits()
+        if hits:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    ADD_HITS.format(product=Product._meta.db_table),
+                    [list(hits), list(hits.values())],
+                )
+            self.stdout.write(f"Added the hits of {len(hits)} products")
+
+        bounds = Product.objects.aggregate(
+            low=Min("id"), high=Max("id"), popularity=Max("popularity")
+        )
+        if bounds["low"] is None:
+            self.stdout.write("No products")
+            return
+
+        # Scaled so the most popular product gets the full weight
+        popularity = bounds["popularity"] or 0
+        params = {
+            "popularity_scale": (
+                config["POPULARITY_WEIGHT"] / math.log1p(popularity)
+                if popularity
+                else 0.0
+            ),
+            "recency_weight": config["RECENCY_WEIGHT"],
+            "half_life": config["RECENCY_HALF_LIFE_DAYS"],
+        }
+        sql = UPDATE_SCORES.format(product=Product._meta.db_table)
+
+        updated = 0
+        batch_size = options["batch"]
+        for start in range(bounds["low"], bounds["high"] + 1, batch_size):
+            params.update(start=start, end=start + batch_size)
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                updated += cursor.rowcount
+            self.stdout.write(
+                f"Scored ids up to {start + batch_size - 1} "
+                f"({updated} rows changed)"
+            )
+
+        if updated:
+            bump_search_generation()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Updated {updated} static scores")
+        )
@@ -0,0 +1,261 @@
+# products/management/commands/import_products.py
+import csv
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+
+from products.cache import bump_search_generation
+from products.models import Brand, Category, Product
+
+TEXT_COLUMNS = [
+    "name_en",
+    "name_ar",
+    "description_en",
+    "description_ar",
+    "barcode",
+    "brand",
+    "category",
+]
+NUMBER_COLUMNS = ["calories", "protein"]
+
+# Per-transaction staging table, loaded with COPY
+CREATE_STAGING = """
+CREATE TEMPORARY TABLE products_import_staging (
+    line bigint,
+    name_en text,
+    name_ar text,
+    description_en text,
+    description_ar text,
+    barcode text,
+    brand text,
+    category text,
+    calories double precision,
+    protein double precision
+) ON COMMIT DROP
+"""
+
+COPY_STAGING = """
+COPY products_import_staging (
+    line, name_en, name_ar, description_en, description_ar, barcode, brand,
+    category, calories, protein
+) FROM STDIN
+"""
+
+# Upsert on barcode. The last line wins for barcodes repeated in a batch,
+# and rows whose values didn't change are left alone, so the search trigger
+# only runs for rows that are actually inserted or modified.
+UPSERT = """
+INSERT INTO {product} AS product (
+    name_en, name_ar, description_en, description_ar, barcode, brand_id,
+    category_id, calories, protein, created_at, updated_at
+)
+SELECT DISTINCT ON (staging.barcode)
+    staging.name_en, staging.name_ar,
+    coalesce(staging.description_en, ''), coalesce(staging.description_ar, ''),
+    staging.barcode, brand.id, category.id, staging.calories, staging.protein,
+    now(), now()
+FROM products_import_staging AS staging
+LEFT JOIN {brand} AS brand ON brand.slug = staging.brand
+LEFT JOIN {category} AS category ON category.slug = staging.category
+ORDER BY staging.barcode, staging.line DESC
+ON CONFLICT (barcode) DO UPDATE SET
+    name_en = EXCLUDED.name_en,
+    name_ar = EXCLUDED.name_ar,
+    description_en = EXCLUDED.description_en,
+    description_ar = EXCLUDED.description_ar,
+    brand_id = EXCLUDED.brand_id,
+    category_id = EXCLUDED.category_id,
+    calories = EXCLUDED.calories,
+    protein = EXCLUDED.protein,
+    updated_at = EXCLUDED.updated_at
+WHERE (
+    product.name_en, product.name_ar, product.description_en,
+    product.description_ar, product.brand_id, product.category_id,
+    product.calories, product.protein
+) IS DISTINCT FROM (
+    EXCLUDED.name_en, EXCLUDED.name_ar, EXCLUDED.description_en,
+    EXCLUDED.description_ar, EXCLUDED.brand_id, EXCLUDED.category_id,
+    EXCLUDED.calories, EXCLUDED.protein
+)
+RETURNING (xmax = 0) AS inserted
+"""
+
+
+def read_records(stream, fmt):
+    # Yields (line, record) one at a time, so memory stays bounded by the
+    # batch size whatever the file size
+    if fmt == "csv":
+        for line, record in enumerate(csv.DictReader(stream), start=2):
+            yield line, record
+    else:
+        for line, text in enumerate(stream, start=1):
+            if not text.strip():
+                continue
+            try:
+                yield line, json.loads(text)
+            except json.JSONDecodeError:
+                # Reported and counted as skipped like any invalid record
+                yield line, None
+
+
+def clean_record(line, record):
+    """Staging row for a record, or None when it can't be upserted."""
+    if not isinstance(record, dict):
+        # Invalid JSON, or a JSON value that isn't an object
+        return None
+    barcode = str(record.get("barcode") or "").strip()
+    if not barcode or not record.get("name_en") or not record.get("name_ar"):
+        return None
+
+    row = [line]
+    for column in TEXT_COLUMNS:
+        value = record.get(column)
+        row.append(str(value).strip() if value not in (None, "") else None)
+    row[TEXT_COLUMNS.index("barcode") + 1] = barcode
+    for column in NUMBER_COLUMNS:
+        value = record.get(column)
+        try:
+            row.append(float(value) if value not in (None, "") else None)
+        except (TypeError, ValueError):
+            return None
+    return row
+
+
+def import_batch(rows):
+    """Loads one batch in its own transaction; returns (inserted, updated)."""
+    upsert = UPSERT.format(
+        product=Product._meta.db_table,
+        brand=Brand._meta.db_table,
+        category=Category._meta.db_table,
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(CREATE_STAGING)
+        with cursor.copy(COPY_STAGING) as copy:
+            for row in rows:
+                copy.write_row(row)
+        cursor.execute(upsert)
+        results = [inserted for (inserted,) in cursor.fetchall()]
+    inserted = sum(results)
+    return inserted, len(results) - inserted
+
+
+def init_worker():
+    # Worker processes open their own database connection on first use
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams products from a CSV or JSONL file into the catalog: each "
+        "batch is COPYed into a staging table and upserted on barcode"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            help="CSV or JSONL file to import, or - for standard input",
+        )
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="Input format (default: from the file extension)",
+        )
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=5000,
+            help="Rows per COPY/upsert transaction (default: 5000)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Processes loading batches in parallel (default: 1)",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path.endswith(".csv") else "jsonl")
+        if path == "-" and not options["format"]:
+            raise CommandError("--format is required when reading stdin")
+
+        stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        self.read = self.skipped = self.inserted = self.updated = 0
+        started = time.perf_counter()
+        try:
+            batches = self.batches(read_records(stream, fmt), options["batch"])
+            if options["workers"] > 1:
+                self.run_parallel(batches, options["workers"])
+            else:
+                for rows in batches:
+                    self.record(import_batch(rows))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            # COPY and INSERT ... ON CONFLICT send no signals. Batches
+            # committed before a failure are visible too
+            if self.inserted or self.updated:
+                bump_search_generation()
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Read {self.read} rows in {elapsed:.1f}s "
+                f"({self.read / elapsed if elapsed else 0:,.0f} rows/sec): "
+                f"{self.inserted} inserted, {self.updated} updated, "
+                f"{self.skipped} skipped"
+            )
+        )
+
+    def batches(self, records, size):
+        while True:
+            chunk = list(itertools.islice(records, size))
+            if not chunk:
+                return
+            rows = []
+            for line, record in chunk:
+                row = clean_record(line, record)
+                if row is None:
+                    self.skipped += 1
+                    reason = (
+                        "missing or invalid fields"
+                        if isinstance(record, dict)
+                        else "not a JSON object"
+                    )
+                    self.stderr.write(f"Skipped line {line}: {reason}")
+                else:
+                    rows.append(row)
+            self.read += len(chunk)
+            if rows:
+                yield rows
+
+    def run_parallel(self, batches, workers):
+        # Forked workers must not share the parent's connection
+        connections.close_all()
+        pending = set()
+        with ProcessPoolExecutor(workers, initializer=init_worker) as pool:
+            for rows in batches:
+                # At most two batches per worker in flight keeps memory
+                # bounded while the reader stays ahead of the workers
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.record(future.result())
+                pending.add(pool.submit(import_batch, rows))
+            for future in pending:
+                self.record(future.result())
+
+    def record(self, counts):
+        inserted, updated = counts
+        self.inserted += inserted
+        self.updated += updated
+        self.stdout.write(
+            f"Imported {self.read} rows: {self.inserted} inserted, "
+            f"{self.updated} updated..."
+        )
@@ -0,0 +1,73 @@
+# products/management/commands/rebuild_search_vectors.py
+from django.core.management.base import BaseCommand
+from django.db.models import F, Max, Min
+from django.utils import timezone
+
+from products.cache import bump_search_generation
+from products.models import Product, SearchVectorRebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds product search vectors in id-range batches, only for rows "
+        "updated since the last rebuild"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch",
+            type=int,
+            default=10000,
+            help="Width of each id range (default: 10000)",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Rebuild every row instead of only the changed ones",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch"]
+
+        queryset = Product.objects.all()
+        last_run = (
+            SearchVectorRebuild.objects.filter(finished_at__isnull=False)
+            .order_by("-started_at")
+            .first()
+        )
+        if last_run and not options["full"]:
+            # Rows saved while the last run was in progress are included
+            # again, since the run started before they were written
+            queryset = queryset.filter(updated_at__gte=last_run.started_at)
+            self.stdout.write(
+                f"Rebuilding rows updated since {last_run.started_at}..."
+            )
+        else:
+            self.stdout.write("Rebuilding all rows...")
+
+        run = SearchVectorRebuild.objects.create()
+        bounds = queryset.aggregate(low=Min("id"), high=Max("id"))
+
+        if bounds["low"] is not None:
+            # Touching the name columns fires the search trigger, which
+            # recomputes every derived column (vectors, name_ar_normalized)
+            # with the same SQL functions as normal writes. Each range is
+            # its own short transaction, so no long lock is held
+            for start in range(bounds["low"], bounds["high"] + 1, batch_size):
+                run.rows_updated += queryset.filter(
+                    id__gte=start, id__lt=start + batch_size
+                ).update(name_en=F("name_en"), name_ar=F("name_ar"))
+                self.stdout.write(
+                    f"Rebuilt ids up to {start + batch_size - 1} "
+                    f"({run.rows_updated} rows)"
+                )
+
+        run.finished_at = timezone.now()
+        run.save(update_fields=["rows_updated", "finished_at"])
+
+        if run.rows_updated:
+            bump_search_generation()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt {run.rows_updated} search vectors")
+        )
@@ -0,0 +1,64 @@
+# products/management/commands/search_scoring.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from products.models import ScoringParameter
+from products.scoring import load_scoring
+
+
+class Command(BaseCommand):
+    help = (
+        "Shows the search scoring configuration, or overrides entries of "
+        "PRODUCT_SEARCH_SCORING in the database without a deploy"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--set",
+            action="append",
+            default=[],
+            metavar="NAME=VALUE",
+            help="Override an entry; repeat for several",
+        )
+        parser.add_argument(
+            "--reset",
+            action="append",
+            default=[],
+            metavar="NAME",
+            help="Drop an override, going back to the setting",
+        )
+
+    def handle(self, *args, **options):
+        defaults = settings.PRODUCT_SEARCH_SCORING
+
+        for assignment in options["set"]:
+            name, _, value = assignment.partition("=")
+            self.check_name(name, defaults)
+            try:
+                value = float(value)
+            except ValueError:
+                raise CommandError(f"{name}: {value!r} is not a number")
+            # Saving bumps the search cache generation, so every worker
+            # reloads the scoring and no cached result keeps the old one
+            ScoringParameter.objects.update_or_create(
+                name=name, defaults={"value": value}
+            )
+
+        for name in options["reset"]:
+            self.check_name(name, defaults)
+            for parameter in ScoringParameter.objects.filter(name=name):
+                parameter.delete()
+
+        overridden = set(
+            ScoringParameter.objects.values_list("name", flat=True)
+        )
+        for name, value in load_scoring().items():
+            source = "database" if name in overridden else "settings"
+            self.stdout.write(f"{name:>20} = {value} ({source})")
+
+    def check_name(self, name, defaults):
+        if name not in defaults:
+            raise CommandError(
+                f"Unknown scoring entry {name!r}; expected one of "
+                f"{', '.join(defaults)}"
+            )
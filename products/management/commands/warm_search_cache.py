@@ -0,0 +1,122 @@
+# products/management/commands/warm_search_cache.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.urls import reverse
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from products.cache import (
+    get_or_compute,
+    get_search_generation,
+    search_cache_key,
+)
+from products.popularity import decay_terms, popular_terms
+from products.views import ProductAPIView
+
+
+class Command(BaseCommand):
+    help = (
+        "Precomputes the cached first page of the most popular searches, "
+        "e.g. after a deploy, a Redis flush or an invalidation; safe to run "
+        "periodically"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=100,
+            help="Number of popular terms to warm (default: 100)",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Searches run in parallel, each holding a database "
+            "connection (default: 4)",
+        )
+        parser.add_argument(
+            "--host",
+            default="localhost",
+            help="Host the cached next/first links point to "
+            "(default: localhost)",
+        )
+        parser.add_argument(
+            "--secure",
+            action="store_true",
+            help="Build https links",
+        )
+        parser.add_argument(
+            "--decay",
+            type=float,
+            help="Multiply the popularity counts by this factor afterwards, "
+            "e.g. 0.5 when run daily",
+        )
+
+    def handle(self, *args, **options):
+        terms = popular_terms(options["top"])
+        if not terms:
+            self.stdout.write("No popular searches recorded yet")
+            return
+
+        generation = get_search_generation()
+        factory = APIRequestFactory()
+        path = reverse("product-list")
+        pending = iter(terms)
+        lock = threading.Lock()
+        self.warmed = 0
+
+        def warm(term):
+            request = Request(factory.get(
+                path,
+                {"search": term},
+                HTTP_HOST=options["host"],
+                secure=options["secure"],
+            ))
+            view = ProductAPIView(
+                request=request, format_kwarg=None, args=(), kwargs={}
+            )
+            # Served from the cache when the entry is still fresh, so a
+            # periodic run only recomputes what expired or was invalidated
+            get_or_compute(
+                search_cache_key(generation, request),
+                lambda: view.get_rendered(request, generation),
+                timeout=settings.PRODUCT_SEARCH_CACHE_TIMEOUT,
+            )
+
+        def worker():
+            # Each worker thread holds its own connection for the whole run
+            try:
+                while True:
+                    with lock:
+                        term = next(pending, None)
+                    if term is None:
+                        return
+                    warm(term)
+                    with lock:
+                        self.warmed += 1
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options["concurrency"]) as pool:
+            workers = [
+                pool.submit(worker) for _ in range(options["concurrency"])
+            ]
+            for future in workers:
+                future.result()
+        elapsed = time.perf_counter() - started
+
+        if options["decay"]:
+            decay_terms(options["decay"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Warmed {self.warmed} searches in {elapsed:.1f}s"
+            )
+        )
@@ -0,0 +1,711 @@
+# products/memory_index.py
+"""
+In-process search index for PRODUCT_SEARCH_BACKEND = "memory": ranks
+?search= in worker memory and leaves the database only the primary key
+lookup of the ranked page.
+
+The index is built from the search documents, reading each row's stored
+tsvector, so lexemes, positions and weights are exactly the ones Postgres
+ranks. Relevance is the formula of products.search.document_search:
+ts_rank (same default weights and position arithmetic) plus pg_trgm
+similarity of both names plus the static score.
+
+Postings are numpy arrays in CSR layout (term -> slice of one flat array)
+rather than Python lists. Rows changed after a build go to a small delta
+segment, shadowing their old entries in the main one; workers pick them up
+by the documents' transaction ids once the search cache generation changes.
+"""
+import logging
+import re
+import threading
+import time
+from array import array
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.db.models import TextField
+from django.db.models.functions import Cast
+
+from .cache import get_search_generation
+from .models import ProductSearchDocument
+
+logger = logging.getLogger("products.search.index")
+
+# ts_rank's default weights of D, C, B and A positions
+RANK_WEIGHTS = np.array([0.1, 0.2, 0.4, 1.0], dtype=np.float32)
+
+# pg_trgm.similarity_threshold default, the cut-off of the % operator
+SIMILARITY_THRESHOLD = 0.3
+
+# A tsvector position packs the weight in its top two bits
+POSITION_MASK = 0x3FFF
+WEIGHT_SHIFT = 14
+WEIGHT_CODES = {"A": 3, "B": 2, "C": 1, "D": 0}
+
+# 'lexeme':1A,5C as printed by tsvector_out, quotes and backslashes doubled
+TSVECTOR_ENTRY = re.compile(
+    r"'([^'\\]*(?:(?:''|\\\\)[^'\\]*)*)'(?::([0-9A-D,]+))?"
+)
+
+# Alphanumeric runs: pg_trgm's words and, with hyphenated compounds, the
+# default parser's tokens
+WORD = re.compile(r"[^\W_]+")
+COMPOUND = re.compile(r"[^\W_]+(?:-[^\W_]+)*")
+
+DOCUMENT_FIELDS = (
+    "id",
+    "brand_id",
+    "category_id",
+    "name_en",
+    "name_ar_normalized",
+    "calories",
+    "protein",
+    "static_score",
+    "lexemes",
+)
+
+
+def trigrams(text):
+    """pg_trgm's trigram set: each lowercased word padded with "  " and " "."""
+    return set().union(*map(word_trigrams, WORD.findall(text.lower())))
+
+
+@lru_cache(maxsize=100000)
+def word_trigrams(word):
+    # Names share most of their words, so building an index mostly hits
+    # the cache
+    padded = f"  {word} "
+    return tuple(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def query_lexemes(value):
+    # plainto_tsquery('simple', value): every word and, for hyphenated
+    # words, the compound and its parts; repeated lexemes count once
+    lexemes = []
+    for token in COMPOUND.findall(value.lower()):
+        parts = token.split("-")
+        if len(parts) > 1:
+            lexemes.append(token)
+        lexemes.extend(parts)
+    return list(dict.fromkeys(lexemes))
+
+
+@lru_cache(maxsize=100000)
+def packed_positions(positions):
+    """
+    "1A,5C" (positions with their weight; D is never printed) -> packed
+    positions, cached since the same strings, mostly short ones like "3A"
+    or "7C", recur across documents.
+    """
+    packed = []
+    for position in positions.split(",") if positions else ():
+        weight = WEIGHT_CODES.get(position[-1])
+        if weight is None:
+            packed.append(int(position))
+        else:
+            packed.append(int(position[:-1]) | weight << WEIGHT_SHIFT)
+    return tuple(packed)
+
+
+def tsvector_escape(lexeme):
+    # Lexemes are indexed as printed, which spares unescaping every entry
+    return lexeme.replace("\\", "\\\\").replace("'", "''")
+
+
+def word_distance(distance):
+    # ts_rank's proximity factor; beyond 100 words apart it is negligible
+    return np.where(
+        distance > 100,
+        1e-30,
+        1.0 / (1.005 + 0.05 * np.exp(np.minimum(distance, 101) / 1.5 - 2)),
+    )
+
+
+def postings(terms, columns, size):
+    """
+    CSR layout of (term, column values...) entries: offsets[term] to
+    offsets[term + 1] slice the returned columns. Entries keep their order
+    within a term, so they stay sorted by document.
+    """
+    terms = np.asarray(terms)
+    order = np.argsort(terms, kind="stable")
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(terms, minlength=size), out=offsets[1:])
+    return offsets, [np.asarray(column)[order] for column in columns]
+
+
+class Query:
+    __slots__ = ("lexemes", "trigrams")
+
+    def __init__(self, value):
+        self.lexemes = query_lexemes(value)
+        self.trigrams = trigrams(value)
+
+
+class Segment:
+    """
+    Immutable index over a batch of search documents. Documents are
+    addressed by their position in the batch.
+    """
+
+    __slots__ = (
+        "ids",
+        "brand_ids",
+        "category_ids",
+        "calories",
+        "protein",
+        "static_scores",
+        "trigram_ids",
+        "name_sizes",
+        "name_offsets",
+        "name_docs",
+        "lexeme_ids",
+        "lexeme_offsets",
+        "lexeme_docs",
+        "lexeme_positions",
+    )
+
+    def __init__(self, rows):
+        ids, brand_ids, category_ids = array("q"), array("q"), array("q")
+        calories, protein, static_scores = array("d"), array("d"), array("d")
+        trigram_ids, lexeme_ids = {}, {}
+        # Per name (English, normalized Arabic): trigram set sizes and the
+        # trigrams, document after document
+        name_sizes = (array("H"), array("H"))
+        name_terms = (array("i"), array("i"))
+        # Entries (lexeme, packed position) per document, document after
+        # document
+        lexeme_counts = array("i")
+        lexeme_terms, lexeme_positions = array("i"), array("H")
+
+        for row in rows:
+            (
+                pk, brand_id, category_id, name_en, name_ar,
+                row_calories, row_protein, static_score, lexemes,
+            ) = row
+            ids.append(pk)
+            brand_ids.append(-1 if brand_id is None else brand_id)
+            category_ids.append(-1 if category_id is None else category_id)
+            calories.append(np.nan if row_calories is None else row_calories)
+            protein.append(np.nan if row_protein is None else row_protein)
+            static_scores.append(static_score)
+
+            for field, name in enumerate((name_en, name_ar)):
+                grams = trigrams(name or "")
+                name_sizes[field].append(len(grams))
+                name_terms[field].extend([
+                    trigram_ids.setdefault(gram, len(trigram_ids))
+                    for gram in grams
+                ])
+
+            count = len(lexeme_terms)
+            for lexeme, positions in TSVECTOR_ENTRY.findall(lexemes or ""):
+                term = lexeme_ids.setdefault(lexeme, len(lexeme_ids))
+                positions = packed_positions(positions)
+                lexeme_terms.extend((term,) * len(positions))
+                lexeme_positions.extend(positions)
+            lexeme_counts.append(len(lexeme_terms) - count)
+
+        self.ids = np.asarray(ids)
+        self.brand_ids = np.asarray(brand_ids)
+        self.category_ids = np.asarray(category_ids)
+        self.calories = np.asarray(calories)
+        self.protein = np.asarray(protein)
+        self.static_scores = np.asarray(static_scores)
+        documents = np.arange(len(ids), dtype=np.int32)
+
+        self.trigram_ids = trigram_ids
+        self.name_sizes = tuple(np.asarray(sizes) for sizes in name_sizes)
+        self.name_offsets, self.name_docs = [], []
+        for terms, sizes in zip(name_terms, self.name_sizes):
+            offsets, (docs,) = postings(
+                terms, [np.repeat(documents, sizes)], len(trigram_ids)
+            )
+            self.name_offsets.append(offsets)
+            self.name_docs.append(docs)
+
+        self.lexeme_ids = lexeme_ids
+        self.lexeme_offsets, (self.lexeme_docs, self.lexeme_positions) = (
+            postings(
+                lexeme_terms,
+                [np.repeat(documents, lexeme_counts), lexeme_positions],
+                len(lexeme_ids),
+            )
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def nbytes(self):
+        arrays = [
+            self.ids, self.brand_ids, self.category_ids, self.calories,
+            self.protein, self.static_scores, self.lexeme_offsets,
+            self.lexeme_docs, self.lexeme_positions,
+            *self.name_sizes, *self.name_offsets, *self.name_docs,
+        ]
+        return sum(column.nbytes for column in arrays)
+
+    def positions_of(self, ids):
+        """Positions of the given ids in this segment, -1 when absent."""
+        found = np.searchsorted(self.ids, ids)
+        found[found == len(self.ids)] = 0
+        if not len(self.ids):
+            return np.full(len(ids), -1)
+        return np.where(self.ids[found] == ids, found, -1)
+
+    def filter_mask(self, filters):
+        # Same conditions as the FilterSet's brand, category and range
+        # filters; NaN (NULL) never matches a range, as in SQL
+        mask = np.ones(len(self), dtype=bool)
+        for name, column in (
+            ("brand", self.brand_ids),
+            ("category", self.category_ids),
+        ):
+            if filters.get(name):
+                mask &= np.isin(column, [int(pk) for pk in filters[name]])
+        for name, column in (
+            ("calories", self.calories),
+            ("protein", self.protein),
+        ):
+            value = filters.get(name)
+            if value and value.start is not None:
+                mask &= column >= float(value.start)
+            if value and value.stop is not None:
+                mask &= column <= float(value.stop)
+        return mask
+
+    def similarity(self, field, query):
+        """pg_trgm similarity() of a name against the query, as float32."""
+        parts = []
+        offsets, docs = self.name_offsets[field], self.name_docs[field]
+        for gram in query.trigrams:
+            term = self.trigram_ids.get(gram)
+            if term is not None:
+                parts.append(docs[offsets[term]:offsets[term + 1]])
+        if not parts:
+            return np.zeros(len(self), dtype=np.float32)
+
+        common = np.bincount(np.concatenate(parts), minlength=len(self))
+        union = len(query.trigrams) + self.name_sizes[field] - common
+        return common.astype(np.float32) / union.astype(np.float32)
+
+    def occurrences(self, lexeme, candidates=None):
+        """
+        (documents, packed positions) of a lexeme, within candidates when
+        given; None when no document has it.
+        """
+        term = self.lexeme_ids.get(tsvector_escape(lexeme))
+        if term is None:
+            return None
+        start, end = self.lexeme_offsets[term], self.lexeme_offsets[term + 1]
+        docs = self.lexeme_docs[start:end]
+        positions = self.lexeme_positions[start:end]
+        if candidates is None:
+            return docs, positions
+        keep = candidates[docs]
+        return docs[keep], positions[keep]
+
+    def candidates(self, query, mask):
+        """
+        Positions of the documents matching the query (all lexemes, i.e.
+        "@@", or either name "%" the query) among mask, with their name
+        similarities.
+        """
+        similarity_en = self.similarity(0, query)
+        similarity_ar = self.similarity(1, query)
+        matches = (similarity_en >= SIMILARITY_THRESHOLD) | (
+            similarity_ar >= SIMILARITY_THRESHOLD
+        )
+
+        if query.lexemes:
+            found = np.zeros(len(self), dtype=np.int32)
+            for lexeme in query.lexemes:
+                occurrences = self.occurrences(lexeme)
+                if occurrences is None:
+                    break
+                # Sorted, so each document's first entry counts it once
+                docs = occurrences[0]
+                found[docs[np.r_[True, docs[1:] != docs[:-1]]]] += 1
+            else:
+                matches |= found == len(query.lexemes)
+
+        positions = np.flatnonzero(matches & mask)
+        return positions, similarity_en[positions], similarity_ar[positions]
+
+    def rank(self, query, positions):
+        """ts_rank(document, plainto_tsquery(query)) of the given documents."""
+        candidates = np.zeros(len(self), dtype=bool)
+        candidates[positions] = True
+        found = [
+            occurrences
+            for occurrences in (
+                self.occurrences(lexeme, candidates)
+                for lexeme in query.lexemes
+            )
+            if occurrences is not None
+        ]
+        if len(query.lexemes) < 2:
+            ranks = self.rank_or(found, len(query.lexemes))
+        else:
+            ranks = self.rank_and(found)
+        return ranks[positions].astype(np.float32)
+
+    def rank_or(self, found, size):
+        # calc_rank_or: per lexeme, occurrence weights decaying with 1/j^2
+        # of their index, the heaviest one counted in full
+        ranks = np.zeros(len(self))
+        for docs, positions in found:
+            if not len(docs):
+                continue
+            starts = np.flatnonzero(np.r_[True, docs[1:] != docs[:-1]])
+            counts = np.diff(np.r_[starts, len(docs)])
+            index = np.arange(len(docs)) - np.repeat(starts, counts)
+            weights = RANK_WEIGHTS[positions >> WEIGHT_SHIFT].astype(float)
+
+            decayed = np.add.reduceat(weights / (index + 1) ** 2, starts)
+            heaviest = np.maximum.reduceat(weights, starts)
+            first = np.minimum.reduceat(
+                np.where(
+                    weights == np.repeat(heaviest, counts), index, len(docs)
+                ),
+                starts,
+            )
+            ranks[docs[starts]] += (
+                heaviest + decayed - heaviest / (first + 1) ** 2
+            ) / 1.64493406685
+        return ranks / size if size else ranks
+
+    def rank_and(self, found):
+        # calc_rank_and: every pair of positions of two different lexemes
+        # in a document contributes by proximity, combined as
+        # 1 - prod(1 - w)
+        log_misses = np.zeros(len(self))
+        paired = np.zeros(len(self), dtype=bool)
+        for i, (docs_a, positions_a) in enumerate(found):
+            for docs_b, positions_b in found[:i]:
+                counts_b = np.bincount(docs_b, minlength=len(self))
+                starts_b = np.cumsum(counts_b) - counts_b
+                repeats = counts_b[docs_a]
+                total = int(repeats.sum())
+                if not total:
+                    continue
+                a = np.repeat(np.arange(len(docs_a)), repeats)
+                b = (
+                    np.arange(total)
+                    - np.repeat(np.cumsum(repeats) - repeats, repeats)
+                    + np.repeat(starts_b[docs_a], repeats)
+                )
+                distance = np.abs(
+                    (positions_a[a] & POSITION_MASK).astype(np.int32)
+                    - (positions_b[b] & POSITION_MASK)
+                )
+                near = distance > 0
+                a, b, distance = a[near], b[near], distance[near]
+                weights = np.sqrt(
+                    RANK_WEIGHTS[positions_a[a] >> WEIGHT_SHIFT]
+                    * RANK_WEIGHTS[positions_b[b] >> WEIGHT_SHIFT]
+                    * word_distance(distance)
+                )
+                log_misses += np.bincount(
+                    docs_a[a],
+                    weights=np.log1p(-weights),
+                    minlength=len(self),
+                )
+                paired[docs_a[a]] = True
+        return np.where(paired, 1.0 - np.exp(log_misses), 0.0)
+
+    def relevance(self, query, positions, similarities, scoring):
+        # Same expression and float4/float8 mix as document_search
+        similarity_en, similarity_ar = similarities
+        names = (similarity_en + similarity_ar).astype(float)
+        return (
+            self.rank(query, positions).astype(float)
+            * scoring["FULLTEXT_WEIGHT"]
+            + names * scoring["NAME_WEIGHT"]
+            + self.static_scores[positions] * scoring["STATIC_WEIGHT"]
+        )
+
+
+class MemoryIndex:
+    """
+    A main segment with the rows dropped since it was built masked out,
+    plus the delta segment of rows changed since. Immutable; updates return
+    a new index so searches never see a half-applied change.
+    """
+
+    __slots__ = ("main", "alive", "delta", "delta_rows", "horizon")
+
+    def __init__(self, main, alive, delta_rows, horizon):
+        self.main = main
+        self.alive = alive
+        self.delta_rows = delta_rows
+        self.delta = Segment(sorted(delta_rows.values()))
+        # Transaction id the next refresh reads from (transaction_horizon)
+        self.horizon = horizon
+
+    @classmethod
+    def build(cls, rows, horizon):
+        main = Segment(rows)
+        alive = np.ones(len(main), dtype=bool)
+        return cls(main, alive, {}, horizon)
+
+    def __len__(self):
+        return int(self.alive.sum()) + len(self.delta_rows)
+
+    def nbytes(self):
+        return self.main.nbytes() + self.alive.nbytes + self.delta.nbytes()
+
+    def ids(self):
+        return np.concatenate([self.main.ids[self.alive], self.delta.ids])
+
+    def updated(self, rows, horizon):
+        """The index with rows (re)indexed in the delta segment."""
+        delta_rows = dict(self.delta_rows)
+        for row in rows:
+            delta_rows[row[0]] = row
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        return MemoryIndex(
+            self.main,
+            self.without(ids),
+            delta_rows,
+            horizon,
+        )
+
+    def removed(self, ids):
+        """The index without the documents of the given ids."""
+        dropped = set(ids.tolist())
+        delta_rows = {
+            pk: row for pk, row in self.delta_rows.items()
+            if pk not in dropped
+        }
+        return MemoryIndex(
+            self.main, self.without(ids), delta_rows, self.horizon
+        )
+
+    def without(self, ids):
+        alive = self.alive.copy()
+        positions = self.main.positions_of(ids)
+        alive[positions[positions >= 0]] = False
+        return alive
+
+    def search(self, value, scoring, limit, filters):
+        """
+        (ids, relevance) of the documents matching value, best first, as
+        document_search ranks them. With limit, the candidates are cut like
+        document_search does: the highest static scores of a bounded scan
+        with STATIC_CANDIDATES, else the highest relevance.
+        """
+        query = Query(value)
+        segments = [(self.main, self.alive), (self.delta, None)]
+        matched = []
+        for segment, alive in segments:
+            mask = segment.filter_mask(filters)
+            if alive is not None:
+                mask &= alive
+            matched.append(segment.candidates(query, mask))
+
+        if limit and scoring["STATIC_CANDIDATES"]:
+            # The highest static scores among the first
+            # STATIC_SCAN_FACTOR * limit matches, as document_search keeps
+            # them; the scan order is taken to be the id order
+            found = np.concatenate([
+                segment.ids[positions]
+                for (segment, _), (positions, *_) in zip(segments, matched)
+            ])
+            statics = np.concatenate([
+                segment.static_scores[positions]
+                for (segment, _), (positions, *_) in zip(segments, matched)
+            ])
+            scanned = np.arange(len(found))
+            scan = limit * scoring["STATIC_SCAN_FACTOR"]
+            if len(found) > scan:
+                scanned = np.argpartition(found, scan - 1)[:scan]
+            if len(found) > limit:
+                keep = np.zeros(len(found), dtype=bool)
+                if len(scanned) > limit:
+                    scanned = scanned[
+                        np.argpartition(-statics[scanned], limit - 1)[:limit]
+                    ]
+                keep[scanned] = True
+                bounds = np.cumsum([0] + [len(m[0]) for m in matched])
+                matched = [
+                    tuple(column[keep[start:end]] for column in columns)
+                    for columns, start, end in zip(
+                        matched, bounds[:-1], bounds[1:]
+                    )
+                ]
+
+        ids, relevance = [], []
+        for (segment, _), (positions, *similarities) in zip(
+            segments, matched
+        ):
+            if not len(positions):
+                continue
+            ids.append(segment.ids[positions])
+            relevance.append(
+                segment.relevance(query, positions, similarities, scoring)
+            )
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        ids, relevance = np.concatenate(ids), np.concatenate(relevance)
+
+        # Same (-relevance, id) order as the keyset pagination
+        order = np.lexsort((ids, -relevance))
+        if limit and not scoring["STATIC_CANDIDATES"]:
+            order = order[:limit]
+        return ids[order], relevance[order]
+
+
+def document_rows(queryset, *extra):
+    # The stored tsvector in its text form, as Segment reads it
+    return queryset.annotate(
+        lexemes=Cast("document", TextField())
+    ).values_list(*DOCUMENT_FIELDS, *extra)
+
+
+def transaction_horizon():
+    """
+    The oldest transaction id still running on the primary. Every
+    transaction below it has committed or aborted, so a later query sees
+    all of their rows; rows of the others may still appear, so refreshes
+    read again from the horizon taken before their previous read.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+        )
+        return cursor.fetchone()[0]
+
+
+def index_documents():
+    # Always the primary: replicas at different lags don't share a
+    # transaction horizon
+    return ProductSearchDocument.objects.using(DEFAULT_DB_ALIAS)
+
+
+def build_index(batch_size=None):
+    """A MemoryIndex of every search document."""
+    batch_size = batch_size or settings.PRODUCT_SEARCH_MEMORY_INDEX["BATCH"]
+    # Taken first: transactions still running while the build streams are
+    # read again by the first refresh
+    horizon = transaction_horizon()
+    rows = document_rows(index_documents().order_by("id")).iterator(
+        chunk_size=batch_size
+    )
+    return MemoryIndex.build(rows, horizon)
+
+
+def refresh_index(index):
+    """
+    index with the documents written by the transactions since its horizon
+    reindexed and the deleted ones dropped, or None when it should be
+    rebuilt instead.
+    """
+    documents = index_documents()
+    # A transaction that started before another one but commits after it
+    # is at or above every horizon taken until it commits, so its rows are
+    # read however many refreshes later that is
+    horizon = transaction_horizon()
+    changed = documents.filter(
+        transaction_id__gte=index.horizon
+    ).order_by("id")
+    rows = list(document_rows(changed))
+    # Rows of transactions that were running at the last refresh are read
+    # again; count them once
+    changed_ids = index.delta_rows.keys() | {row[0] for row in rows}
+    if len(changed_ids) > settings.PRODUCT_SEARCH_MEMORY_INDEX["MAX_DELTA"]:
+        return None
+    index = index.updated(rows, horizon)
+
+    # Deletions leave no row behind; the counts only differ when there
+    # were some
+    if documents.count() != len(index):
+        stored = np.fromiter(
+            documents.values_list("id", flat=True).iterator(),
+            dtype=np.int64,
+        )
+        index = index.removed(np.setdiff1d(index.ids(), stored))
+    return index
+
+
+class IndexLoader:
+    """
+    The MemoryIndex of this process. Built and kept up to date by a
+    background thread started on first use; get() returns None until the
+    first build finishes.
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.index = None
+        self.generation = None
+        self.built_at = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(
+                        target=self.run, name="search-index", daemon=True
+                    )
+                    self.thread.start()
+        return self.index
+
+    def run(self):
+        while True:
+            try:
+                self.update()
+            except Exception:
+                logger.exception("Search index update failed")
+            finally:
+                # The thread's own connection; not left open between checks
+                connection.close()
+            time.sleep(self.options["REFRESH_INTERVAL"])
+
+    def update(self):
+        generation = get_search_generation()
+        if self.index is not None and generation == self.generation:
+            if time.monotonic() - self.built_at < self.options["MAX_AGE"]:
+                return
+
+        index = None
+        if self.index is not None and generation != self.generation:
+            index = refresh_index(self.index)
+        if index is None:
+            started = time.perf_counter()
+            index = build_index()
+            self.built_at = time.monotonic()
+            logger.info(
+                "Search index built: %d documents, %.1f MB in %.1fs",
+                len(index),
+                index.nbytes() / 1024 / 1024,
+                time.perf_counter() - started,
+            )
+        # Swapped in one assignment, like the in-process lookups
+        self.index = index
+        self.generation = generation
+
+    def render_metrics(self):
+        index = self.index
+        if index is None:
+            return []
+        return [
+            "# HELP product_search_index_documents Documents in this "
+            "worker's in-memory search index.",
+            "# TYPE product_search_index_documents gauge",
+            f"product_search_index_documents {len(index)}",
+            "# HELP product_search_index_delta_documents Documents changed "
+            "since the index was built.",
+            "# TYPE product_search_index_delta_documents gauge",
+            f"product_search_index_delta_documents {len(index.delta_rows)}",
+            "# HELP product_search_index_bytes Size of the index arrays.",
+            "# TYPE product_search_index_bytes gauge",
+            f"product_search_index_bytes {index.nbytes()}",
+        ]
+
+
+search_index = IndexLoader(settings.PRODUCT_SEARCH_MEMORY_INDEX)
@@ -0,0 +1,29 @@
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+def rebuild_search_vectors(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    Product.objects.update(
+        search_vector_en=(
+            SearchVector("name_en", weight="A", config="simple")
+            + SearchVector("description_en", weight="B", config="simple")
+        ),
+        search_vector_ar=(
+            SearchVector("name_ar", weight="A", config="simple")
+            + SearchVector("description_ar", weight="B", config="simple")
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            rebuild_search_vectors, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations, models
+
+# Vectors are maintained by the database so every write path (save,
+# bulk_create, QuerySet.update, raw SQL) keeps them correct without an
+# extra UPDATE per row
+CREATE_TRIGGER = """
+CREATE OR REPLACE FUNCTION products_search_vector(name text, description text)
+RETURNS tsvector LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT setweight(to_tsvector('simple', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+$$;
+
+CREATE OR REPLACE FUNCTION products_product_search_vectors()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_vector_en := products_search_vector(
+        NEW.name_en, NEW.description_en
+    );
+    NEW.search_vector_ar := products_search_vector(
+        NEW.name_ar, NEW.description_ar
+    );
+    RETURN NEW;
+END
+$$;
+
+CREATE TRIGGER products_product_search_vectors
+BEFORE INSERT OR UPDATE OF name_en, name_ar, description_en, description_ar
+ON products_product
+FOR EACH ROW EXECUTE FUNCTION products_product_search_vectors();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS products_product_search_vectors ON products_product;
+DROP FUNCTION IF EXISTS products_product_search_vectors();
+DROP FUNCTION IF EXISTS products_search_vector(text, text);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0002_rebuild_weighted_search_vectors"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+        migrations.CreateModel(
+            name="SearchVectorRebuild",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("rows_updated", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,98 @@
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+# Must stay in step with products.normalization.normalize_search_term, which
+# applies the same folding to queries
+CREATE_FUNCTIONS = r"""
+CREATE OR REPLACE FUNCTION products_normalize_ar(value text)
+RETURNS text LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT btrim(regexp_replace(
+        translate(
+            regexp_replace(
+                lower(normalize(coalesce(value, ''), NFKC)),
+                '[\u064B-\u0652\u0670\u0640]', '', 'g'
+            ),
+            U&'\0623\0625\0622\0671\0649\0629',
+            U&'\0627\0627\0627\0627\064A\0647'
+        ),
+        '\s+', ' ', 'g'
+    ))
+$$;
+
+CREATE OR REPLACE FUNCTION products_product_search_vectors()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_vector_en := products_search_vector(
+        NEW.name_en, NEW.description_en
+    );
+    NEW.name_ar_normalized := products_normalize_ar(NEW.name_ar);
+    NEW.search_vector_ar := products_search_vector(
+        NEW.name_ar_normalized, products_normalize_ar(NEW.description_ar)
+    );
+    RETURN NEW;
+END
+$$;
+"""
+
+# Fires the trigger for every row
+BACKFILL = "UPDATE products_product SET name_ar = name_ar;"
+
+RESTORE_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION products_product_search_vectors()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_vector_en := products_search_vector(
+        NEW.name_en, NEW.description_en
+    );
+    NEW.search_vector_ar := products_search_vector(
+        NEW.name_ar, NEW.description_ar
+    );
+    RETURN NEW;
+END
+$$;
+
+DROP FUNCTION IF EXISTS products_normalize_ar(text);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0005_name_prefix_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="name_ar_normalized",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=255
+            ),
+        ),
+        migrations.RunSQL(CREATE_FUNCTIONS, RESTORE_FUNCTIONS),
+        migrations.RunSQL(BACKFILL, BACKFILL),
+        migrations.RemoveIndex(
+            model_name="product",
+            name="name_ar_trgm_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="product",
+            name="name_ar_prefix_idx",
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["name_ar_normalized"],
+                name="name_ar_norm_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["name_ar_normalized"],
+                name="name_ar_norm_prefix_idx",
+                opclasses=["text_pattern_ops"],
+            ),
+        ),
+    ]
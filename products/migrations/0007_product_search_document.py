@@ -0,0 +1,230 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+# Search documents are kept in step by statement-level triggers, so bulk
+# writes (COPY upserts, QuerySet.update) refresh all their rows with one
+# INSERT ... ON CONFLICT instead of one per row
+CREATE_TRIGGERS = r"""
+-- Same text as the API's DateTimeField output for UTC
+CREATE OR REPLACE FUNCTION products_format_timestamp(value timestamptz)
+RETURNS text LANGUAGE sql STABLE PARALLEL SAFE AS $$
+    SELECT to_char(value AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS')
+        || CASE
+            WHEN date_part('microseconds', value)::bigint % 1000000 <> 0
+            THEN to_char(value AT TIME ZONE 'UTC', '.US')
+            ELSE ''
+        END
+        || 'Z'
+$$;
+
+CREATE OR REPLACE FUNCTION products_refresh_search_documents(ids bigint[])
+RETURNS void LANGUAGE sql AS $$
+    INSERT INTO products_productsearchdocument (
+        id, brand_id, category_id, name_en, name_ar_normalized, barcode,
+        calories, protein, document, payload
+    )
+    SELECT
+        product.id,
+        product.brand_id,
+        product.category_id,
+        product.name_en,
+        product.name_ar_normalized,
+        product.barcode,
+        product.calories,
+        product.protein,
+        setweight(to_tsvector('simple', concat_ws(' ',
+            product.name_en, product.name_ar_normalized
+        )), 'A')
+        || setweight(to_tsvector('simple', concat_ws(' ',
+            brand.name_en, products_normalize_ar(brand.name_ar),
+            category.name_en, products_normalize_ar(category.name_ar)
+        )), 'B')
+        || setweight(to_tsvector('simple', concat_ws(' ',
+            product.description_en,
+            products_normalize_ar(product.description_ar)
+        )), 'C'),
+        json_build_object(
+            'id', product.id,
+            'brand', CASE WHEN brand.id IS NOT NULL THEN json_build_object(
+                'id', brand.id,
+                'name_en', brand.name_en,
+                'name_ar', brand.name_ar,
+                'slug', brand.slug
+            ) END,
+            'category', CASE WHEN category.id IS NOT NULL THEN json_build_object(
+                'id', category.id,
+                'name_en', category.name_en,
+                'name_ar', category.name_ar,
+                'slug', category.slug
+            ) END,
+            'name_en', product.name_en,
+            'name_ar', product.name_ar,
+            'description_en', product.description_en,
+            'description_ar', product.description_ar,
+            'barcode', product.barcode,
+            'calories', product.calories,
+            'protein', product.protein,
+            'created_at', products_format_timestamp(product.created_at),
+            'updated_at', products_format_timestamp(product.updated_at)
+        )::text
+    FROM products_product AS product
+    LEFT JOIN products_brand AS brand ON brand.id = product.brand_id
+    LEFT JOIN products_category AS category
+        ON category.id = product.category_id
+    WHERE product.id = ANY(ids)
+    ON CONFLICT (id) DO UPDATE SET
+        brand_id = EXCLUDED.brand_id,
+        category_id = EXCLUDED.category_id,
+        name_en = EXCLUDED.name_en,
+        name_ar_normalized = EXCLUDED.name_ar_normalized,
+        barcode = EXCLUDED.barcode,
+        calories = EXCLUDED.calories,
+        protein = EXCLUDED.protein,
+        document = EXCLUDED.document,
+        payload = EXCLUDED.payload
+$$;
+
+CREATE OR REPLACE FUNCTION products_product_documents_changed()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM products_refresh_search_documents(ARRAY(SELECT id FROM changed));
+    RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION products_product_documents_removed()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM products_productsearchdocument
+    WHERE id IN (SELECT id FROM removed);
+    RETURN NULL;
+END
+$$;
+
+-- Only renames matter; products of the brand or category are refreshed
+CREATE OR REPLACE FUNCTION products_related_documents_changed()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'products_brand' THEN
+        PERFORM products_refresh_search_documents(ARRAY(
+            SELECT product.id
+            FROM changed
+            JOIN previous USING (id)
+            JOIN products_product AS product ON product.brand_id = changed.id
+            WHERE (changed.name_en, changed.name_ar, changed.slug)
+                IS DISTINCT FROM
+                (previous.name_en, previous.name_ar, previous.slug)
+        ));
+    ELSE
+        PERFORM products_refresh_search_documents(ARRAY(
+            SELECT product.id
+            FROM changed
+            JOIN previous USING (id)
+            JOIN products_product AS product
+                ON product.category_id = changed.id
+            WHERE (changed.name_en, changed.name_ar, changed.slug)
+                IS DISTINCT FROM
+                (previous.name_en, previous.name_ar, previous.slug)
+        ));
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER products_product_documents_inserted
+AFTER INSERT ON products_product
+REFERENCING NEW TABLE AS changed
+FOR EACH STATEMENT EXECUTE FUNCTION products_product_documents_changed();
+
+CREATE TRIGGER products_product_documents_updated
+AFTER UPDATE ON products_product
+REFERENCING NEW TABLE AS changed
+FOR EACH STATEMENT EXECUTE FUNCTION products_product_documents_changed();
+
+CREATE TRIGGER products_product_documents_deleted
+AFTER DELETE ON products_product
+REFERENCING OLD TABLE AS removed
+FOR EACH STATEMENT EXECUTE FUNCTION products_product_documents_removed();
+
+CREATE TRIGGER products_brand_documents
+AFTER UPDATE ON products_brand
+REFERENCING OLD TABLE AS previous NEW TABLE AS changed
+FOR EACH STATEMENT EXECUTE FUNCTION products_related_documents_changed();
+
+CREATE TRIGGER products_category_documents
+AFTER UPDATE ON products_category
+REFERENCING OLD TABLE AS previous NEW TABLE AS changed
+FOR EACH STATEMENT EXECUTE FUNCTION products_related_documents_changed();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER IF EXISTS products_category_documents ON products_category;
+DROP TRIGGER IF EXISTS products_brand_documents ON products_brand;
+DROP TRIGGER IF EXISTS products_product_documents_deleted ON products_product;
+DROP TRIGGER IF EXISTS products_product_documents_updated ON products_product;
+DROP TRIGGER IF EXISTS products_product_documents_inserted ON products_product;
+DROP FUNCTION IF EXISTS products_related_documents_changed();
+DROP FUNCTION IF EXISTS products_product_documents_removed();
+DROP FUNCTION IF EXISTS products_product_documents_changed();
+DROP FUNCTION IF EXISTS products_refresh_search_documents(bigint[]);
+DROP FUNCTION IF EXISTS products_format_timestamp(timestamptz);
+"""
+
+BACKFILL = """
+SELECT products_refresh_search_documents(ARRAY(SELECT id FROM products_product));
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0006_arabic_normalization"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductSearchDocument",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("brand_id", models.BigIntegerField(null=True)),
+                ("category_id", models.BigIntegerField(null=True)),
+                ("name_en", models.CharField(max_length=255)),
+                ("name_ar_normalized", models.CharField(max_length=255)),
+                ("barcode", models.CharField(max_length=100, null=True)),
+                ("calories", models.FloatField(null=True)),
+                ("protein", models.FloatField(null=True)),
+                ("document", django.contrib.postgres.search.SearchVectorField()),
+                ("payload", models.TextField()),
+            ],
+            options={
+                "indexes": [
+                    django.contrib.postgres.indexes.GinIndex(
+                        fields=["document"], name="products_pr_documen_eb9ed7_gin"
+                    ),
+                    django.contrib.postgres.indexes.GinIndex(
+                        fields=["name_en"],
+                        name="document_name_en_trgm_idx",
+                        opclasses=["gin_trgm_ops"],
+                    ),
+                    django.contrib.postgres.indexes.GinIndex(
+                        fields=["name_ar_normalized"],
+                        name="document_name_ar_trgm_idx",
+                        opclasses=["gin_trgm_ops"],
+                    ),
+                    models.Index(
+                        fields=["barcode"], name="products_pr_barcode_c133dc_idx"
+                    ),
+                    models.Index(
+                        fields=["brand_id"], name="products_pr_brand_i_69ac54_idx"
+                    ),
+                    models.Index(
+                        fields=["category_id"],
+                        name="products_pr_categor_c8dd65_idx",
+                    ),
+                ],
+            },
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, DROP_TRIGGERS),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,135 @@
+from django.db import migrations, models
+
+# Search documents copy the static score; existing rows already hold the
+# column default, like the products, so no backfill is needed
+REFRESH_FUNCTION = r"""
+CREATE OR REPLACE FUNCTION products_refresh_search_documents(ids bigint[])
+RETURNS void LANGUAGE sql AS $$
+    INSERT INTO products_productsearchdocument (
+        id, brand_id, category_id, name_en, name_ar_normalized, barcode,
+        calories, protein, static_score, document, payload
+    )
+    SELECT
+        product.id,
+        product.brand_id,
+        product.category_id,
+        product.name_en,
+        product.name_ar_normalized,
+        product.barcode,
+        product.calories,
+        product.protein,
+        product.static_score,
+        setweight(to_tsvector('simple', concat_ws(' ',
+            product.name_en, product.name_ar_normalized
+        )), 'A')
+        || setweight(to_tsvector('simple', concat_ws(' ',
+            brand.name_en, products_normalize_ar(brand.name_ar),
+            category.name_en, products_normalize_ar(category.name_ar)
+        )), 'B')
+        || setweight(to_tsvector('simple', concat_ws(' ',
+            product.description_en,
+            products_normalize_ar(product.description_ar)
+        )), 'C'),
+        json_build_object(
+            'id', product.id,
+            'brand', CASE WHEN brand.id IS NOT NULL THEN json_build_object(
+                'id', brand.id,
+                'name_en', brand.name_en,
+                'name_ar', brand.name_ar,
+                'slug', brand.slug
+            ) END,
+            'category', CASE WHEN category.id IS NOT NULL THEN json_build_object(
+                'id', category.id,
+                'name_en', category.name_en,
+                'name_ar', category.name_ar,
+                'slug', category.slug
+            ) END,
+            'name_en', product.name_en,
+            'name_ar', product.name_ar,
+            'description_en', product.description_en,
+            'description_ar', product.description_ar,
+            'barcode', product.barcode,
+            'calories', product.calories,
+            'protein', product.protein,
+            'created_at', products_format_timestamp(product.created_at),
+            'updated_at', products_format_timestamp(product.updated_at)
+        )::text
+    FROM products_product AS product
+    LEFT JOIN products_brand AS brand ON brand.id = product.brand_id
+    LEFT JOIN products_category AS category
+        ON category.id = product.category_id
+    WHERE product.id = ANY(ids)
+    ON CONFLICT (id) DO UPDATE SET
+        brand_id = EXCLUDED.brand_id,
+        category_id = EXCLUDED.category_id,
+        name_en = EXCLUDED.name_en,
+        name_ar_normalized = EXCLUDED.name_ar_normalized,
+        barcode = EXCLUDED.barcode,
+        calories = EXCLUDED.calories,
+        protein = EXCLUDED.protein,
+        static_score = EXCLUDED.static_score,
+        document = EXCLUDED.document,
+        payload = EXCLUDED.payload
+$$;
+"""
+
+PREVIOUS_REFRESH_FUNCTION = (
+    REFRESH_FUNCTION.replace(", static_score", "")
+    .replace("\n        product.static_score,", "")
+    .replace("\n        static_score = EXCLUDED.static_score,", "")
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0007_product_search_document"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="popularity",
+            field=models.PositiveIntegerField(db_default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="static_score",
+            field=models.FloatField(db_default=0.0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="productsearchdocument",
+            name="static_score",
+            field=models.FloatField(db_default=0.0),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["-static_score"], name="product_static_score_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productsearchdocument",
+            index=models.Index(
+                fields=["-static_score"], name="document_static_score_idx"
+            ),
+        ),
+        migrations.RunSQL(REFRESH_FUNCTION, PREVIOUS_REFRESH_FUNCTION),
+        migrations.CreateModel(
+            name="ScoringParameter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, unique=True)),
+                ("value", models.FloatField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,116 @@
+from django.db import migrations, models
+
+# Every write of a search document takes the next revision, so in-memory
+# search indexes can read just the rows written since their last look.
+# Existing rows keep revision 0; an index reads them all when it is built
+CREATE_SEQUENCE = """
+CREATE SEQUENCE products_search_document_revision_seq;
+"""
+
+DROP_SEQUENCE = """
+DROP SEQUENCE IF EXISTS products_search_document_revision_seq;
+"""
+
+REFRESH_FUNCTION = r"""
+CREATE OR REPLACE FUNCTION products_refresh_search_documents(ids bigint[])
+RETURNS void LANGUAGE sql AS $$
+    INSERT INTO products_productsearchdocument (
+        id, brand_id, category_id, name_en, name_ar_normalized, barcode,
+        calories, protein, static_score, revision, document, payload
+    )
+    SELECT
+        product.id,
+        product.brand_id,
+        product.category_id,
+        product.name_en,
+        product.name_ar_normalized,
+        product.barcode,
+        product.calories,
+        product.protein,
+        product.static_score,
+        nextval('products_search_document_revision_seq'),
+        setweight(to_tsvector('simple', concat_ws(' ',
+            product.name_en, product.name_ar_normalized
+        )), 'A')
+        || setweight(to_tsvector('simple', concat_ws(' ',
+            brand.name_en, products_normalize_ar(brand.name_ar),
+            category.name_en, products_normalize_ar(category.name_ar)
+        )), 'B')
+        || setweight(to_tsvector('simple', concat_ws(' ',
+            product.description_en,
+            products_normalize_ar(product.description_ar)
+        )), 'C'),
+        json_build_object(
+            'id', product.id,
+            'brand', CASE WHEN brand.id IS NOT NULL THEN json_build_object(
+                'id', brand.id,
+                'name_en', brand.name_en,
+                'name_ar', brand.name_ar,
+                'slug', brand.slug
+            ) END,
+            'category', CASE WHEN category.id IS NOT NULL THEN json_build_object(
+                'id', category.id,
+                'name_en', category.name_en,
+                'name_ar', category.name_ar,
+                'slug', category.slug
+            ) END,
+            'name_en', product.name_en,
+            'name_ar', product.name_ar,
+            'description_en', product.description_en,
+            'description_ar', product.description_ar,
+            'barcode', product.barcode,
+            'calories', product.calories,
+            'protein', product.protein,
+            'created_at', products_format_timestamp(product.created_at),
+            'updated_at', products_format_timestamp(product.updated_at)
+        )::text
+    FROM products_product AS product
+    LEFT JOIN products_brand AS brand ON brand.id = product.brand_id
+    LEFT JOIN products_category AS category
+        ON category.id = product.category_id
+    WHERE product.id = ANY(ids)
+    ON CONFLICT (id) DO UPDATE SET
+        brand_id = EXCLUDED.brand_id,
+        category_id = EXCLUDED.category_id,
+        name_en = EXCLUDED.name_en,
+        name_ar_normalized = EXCLUDED.name_ar_normalized,
+        barcode = EXCLUDED.barcode,
+        calories = EXCLUDED.calories,
+        protein = EXCLUDED.protein,
+        static_score = EXCLUDED.static_score,
+        revision = EXCLUDED.revision,
+        document = EXCLUDED.document,
+        payload = EXCLUDED.payload
+$$;
+"""
+
+PREVIOUS_REFRESH_FUNCTION = (
+    REFRESH_FUNCTION.replace(", revision", "")
+    .replace("\n        nextval('products_search_document_revision_seq'),", "")
+    .replace("\n        revision = EXCLUDED.revision,", "")
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0008_static_score"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productsearchdocument",
+            name="revision",
+            field=models.BigIntegerField(db_default=0),
+        ),
+        migrations.AddIndex(
+            model_name="productsearchdocument",
+            index=models.Index(
+                fields=["revision"], name="document_revision_idx"
+            ),
+        ),
+        migrations.RunSQL(
+            CREATE_SEQUENCE + REFRESH_FUNCTION,
+            PREVIOUS_REFRESH_FUNCTION + DROP_SEQUENCE,
+        ),
+    ]
@@ -0,0 +1,49 @@
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.db import migrations, models
+
+# text_pattern_ops indexes serve LIKE 'abc%' under any collation but can't
+# return rows in the database collation's order, so every suggestion
+# sorted all prefix matches. With COLLATE "C" on both the index and the
+# query, one btree gives the prefix range and the DISTINCT ON order
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0009_document_revision"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="product",
+            name="name_en_prefix_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="product",
+            name="name_ar_norm_prefix_idx",
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                django.db.models.functions.comparison.Collate(
+                    django.db.models.functions.text.Lower("name_en"), "C"
+                ),
+                models.F("id"),
+                name="name_en_c_prefix_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                django.db.models.functions.comparison.Collate(
+                    django.db.models.functions.comparison.Cast(
+                        "name_ar_normalized", models.TextField()
+                    ),
+                    "C",
+                ),
+                models.F("id"),
+                name="name_ar_norm_c_prefix_idx",
+            ),
+        ),
+    ]
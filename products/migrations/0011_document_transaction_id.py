@@ -0,0 +1,56 @@
+from importlib import import_module
+
+from django.db import migrations, models
+
+# Documents record the id of the transaction that wrote them instead of a
+# sequence value. Sequence values are taken before commit, in any order,
+# so an index reading past the highest one it saw skipped transactions
+# that committed late; with transaction ids it reads from the oldest
+# transaction still running (pg_snapshot_xmin). Existing rows get 0 and
+# are read when an index is built
+previous = import_module("products.migrations.0009_document_revision")
+
+REFRESH_FUNCTION = (
+    previous.REFRESH_FUNCTION.replace(", revision,", ", transaction_id,")
+    .replace(
+        "nextval('products_search_document_revision_seq')",
+        "pg_current_xact_id()::text::bigint",
+    )
+    .replace(
+        "revision = EXCLUDED.revision",
+        "transaction_id = EXCLUDED.transaction_id",
+    )
+)
+
+assert "revision" not in REFRESH_FUNCTION
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0010_name_prefix_c_collation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productsearchdocument",
+            name="transaction_id",
+            field=models.BigIntegerField(db_default=0),
+        ),
+        migrations.AddIndex(
+            model_name="productsearchdocument",
+            index=models.Index(
+                fields=["transaction_id"], name="document_transaction_idx"
+            ),
+        ),
+        migrations.RunSQL(REFRESH_FUNCTION, previous.REFRESH_FUNCTION),
+        migrations.RemoveIndex(
+            model_name="productsearchdocument",
+            name="document_revision_idx",
+        ),
+        migrations.RemoveField(
+            model_name="productsearchdocument",
+            name="revision",
+        ),
+        migrations.RunSQL(previous.DROP_SEQUENCE, previous.CREATE_SEQUENCE),
+    ]
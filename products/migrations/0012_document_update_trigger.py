@@ -0,0 +1,110 @@
+from importlib import import_module
+
+from django.db import migrations
+
+# The UPDATE trigger used to rebuild the document of every updated row,
+# including updates of columns documents don't hold, such as popularity
+# (compute_static_scores), or hold unsearched, such as static_score. It
+# now compares the old and new rows, as the brand/category trigger does:
+# documents are rebuilt only when a searched or payload column changed,
+# and static_score is copied on its own
+previous = import_module("products.migrations.0011_document_transaction_id")
+
+# json_build_object writes double precision 120.0 as 120, where the API's
+# encoder (a Python float) writes 120.0
+FLOAT_FUNCTION = r"""
+CREATE OR REPLACE FUNCTION products_json_float(value double precision)
+RETURNS json LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT CASE
+        WHEN value = trunc(value) AND abs(value) < 1e16
+        THEN (value::numeric::text || '.0')::json
+        ELSE to_json(value)
+    END
+$$;
+"""
+
+REFRESH_FUNCTION = previous.REFRESH_FUNCTION.replace(
+    "'calories', product.calories,",
+    "'calories', products_json_float(product.calories),",
+).replace(
+    "'protein', product.protein,",
+    "'protein', products_json_float(product.protein),",
+)
+
+assert REFRESH_FUNCTION.count("products_json_float") == 2
+
+UPDATE_TRIGGER = r"""
+CREATE OR REPLACE FUNCTION products_product_documents_updated()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM products_refresh_search_documents(ARRAY(
+        SELECT changed.id
+        FROM changed
+        JOIN previous USING (id)
+        WHERE (
+            changed.name_en, changed.name_ar, changed.name_ar_normalized,
+            changed.description_en, changed.description_ar, changed.barcode,
+            changed.brand_id, changed.category_id, changed.calories,
+            changed.protein, changed.created_at, changed.updated_at
+        ) IS DISTINCT FROM (
+            previous.name_en, previous.name_ar, previous.name_ar_normalized,
+            previous.description_en, previous.description_ar,
+            previous.barcode, previous.brand_id, previous.category_id,
+            previous.calories, previous.protein, previous.created_at,
+            previous.updated_at
+        )
+    ));
+    -- Rows rebuilt above already hold the new score and transaction id
+    UPDATE products_productsearchdocument AS document
+    SET
+        static_score = changed.static_score,
+        transaction_id = pg_current_xact_id()::text::bigint
+    FROM changed
+    JOIN previous USING (id)
+    WHERE document.id = changed.id
+        AND changed.static_score IS DISTINCT FROM previous.static_score
+        AND document.static_score IS DISTINCT FROM changed.static_score;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER products_product_documents_updated ON products_product;
+CREATE TRIGGER products_product_documents_updated
+AFTER UPDATE ON products_product
+REFERENCING OLD TABLE AS previous NEW TABLE AS changed
+FOR EACH STATEMENT EXECUTE FUNCTION products_product_documents_updated();
+"""
+
+PREVIOUS_UPDATE_TRIGGER = r"""
+DROP TRIGGER products_product_documents_updated ON products_product;
+CREATE TRIGGER products_product_documents_updated
+AFTER UPDATE ON products_product
+REFERENCING NEW TABLE AS changed
+FOR EACH STATEMENT EXECUTE FUNCTION products_product_documents_changed();
+DROP FUNCTION products_product_documents_updated();
+"""
+
+# Rewrites the payloads whose numbers were written without the .0
+REFRESH_FLOATS = """
+SELECT products_refresh_search_documents(ARRAY(
+    SELECT id FROM products_product
+    WHERE calories = trunc(calories) OR protein = trunc(protein)
+));
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0011_document_transaction_id"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            FLOAT_FUNCTION + REFRESH_FUNCTION,
+            previous.REFRESH_FUNCTION
+            + "DROP FUNCTION products_json_float(double precision);",
+        ),
+        migrations.RunSQL(UPDATE_TRIGGER, PREVIOUS_UPDATE_TRIGGER),
+        migrations.RunSQL(REFRESH_FLOATS, migrations.RunSQL.noop),
+    ]
@@ -2,6 +2,8 @@
 from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Cast, Collate, Lower
 
 
 class Category(models.Model):
@@ -36,11 +38,22 @@ class Product(models.Model):
     # Search fields
     search_vector_en = SearchVectorField(null=True, blank=True)
     search_vector_ar = SearchVectorField(null=True, blank=True)
+    # name_ar with Arabic letter variants and tashkeel folded, filled by the
+    # database trigger like the vectors
+    name_ar_normalized = models.CharField(
+        max_length=255, blank=True, default="", editable=False
+    )
 
     # Nutrition facts (simplified)
     calories = models.FloatField(null=True, blank=True)
     protein = models.FloatField(null=True, blank=True)
 
+    # Query-independent ranking signal in [0, 1] from popularity and
+    # recency, precomputed by the compute_static_scores command, which
+    # also adds the sampled barcode lookups to popularity
+    popularity = models.PositiveIntegerField(db_default=0)
+    static_score = models.FloatField(db_default=0.0, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -54,14 +67,120 @@ class Product(models.Model):
                 opclasses=["gin_trgm_ops"],
             ),
             GinIndex(
-                fields=["name_ar"],
-                name="name_ar_trgm_idx",
+                fields=["name_ar_normalized"],
+                name="name_ar_norm_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+            GinIndex(
+                fields=["description_en"],
+                name="description_en_trgm_idx",
                 opclasses=["gin_trgm_ops"],
             ),
+            GinIndex(
+                fields=["description_ar"],
+                name="description_ar_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+            # Prefix (LIKE 'abc%') lookups for suggestions, in the order
+            # of the C collation they compare with (see suggest_name_key)
+            models.Index(
+                Collate(Lower("name_en"), "C"),
+                F("id"),
+                name="name_en_c_prefix_idx",
+            ),
+            models.Index(
+                Collate(Cast("name_ar_normalized", models.TextField()), "C"),
+                F("id"),
+                name="name_ar_norm_c_prefix_idx",
+            ),
             models.Index(fields=["barcode"]),
             models.Index(fields=["brand"]),
             models.Index(fields=["category"]),
+            models.Index(
+                fields=["-static_score"], name="product_static_score_idx"
+            ),
         ]
 
     def __str__(self):
         return self.name_en
+
+
+class ProductSearchDocument(models.Model):
+    """
+    Search-only copy of a product with its brand and category names, so
+    search reads one table. Rows are written by database triggers on
+    products, brands and categories (migration 0007), never by Django.
+    """
+
+    # Same value as the product's id
+    id = models.BigIntegerField(primary_key=True)
+    brand_id = models.BigIntegerField(null=True)
+    category_id = models.BigIntegerField(null=True)
+    name_en = models.CharField(max_length=255)
+    name_ar_normalized = models.CharField(max_length=255)
+    barcode = models.CharField(max_length=100, null=True)
+    calories = models.FloatField(null=True)
+    protein = models.FloatField(null=True)
+    static_score = models.FloatField(db_default=0.0)
+
+    # Product names (A), brand and category names (B) and descriptions (C)
+    # in both languages, Arabic normalized
+    document = SearchVectorField()
+    # The product's list representation, rendered as JSON by the database
+    payload = models.TextField()
+    # Id of the transaction that last wrote the row, so in-memory indexes
+    # (products.memory_index) read only the rows changed since they looked
+    transaction_id = models.BigIntegerField(db_default=0)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=["document"]),
+            GinIndex(
+                fields=["name_en"],
+                name="document_name_en_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+            GinIndex(
+                fields=["name_ar_normalized"],
+                name="document_name_ar_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+            models.Index(fields=["barcode"]),
+            models.Index(fields=["brand_id"]),
+            models.Index(fields=["category_id"]),
+            models.Index(
+                fields=["-static_score"], name="document_static_score_idx"
+            ),
+            models.Index(
+                fields=["transaction_id"], name="document_transaction_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return self.name_en
+
+
+class SearchVectorRebuild(models.Model):
+    """A run of the rebuild_search_vectors command."""
+
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    rows_updated = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Rebuild started {self.started_at:%Y-%m-%d %H:%M}"
+
+
+class ScoringParameter(models.Model):
+    """
+    Database override of one PRODUCT_SEARCH_SCORING entry, so ranking can
+    be tuned without a deploy. Saving or deleting one starts a new search
+    cache generation.
+    """
+
+    name = models.CharField(max_length=50, unique=True)
+    value = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}={self.value}"
@@ -0,0 +1,30 @@
+# products/normalization.py
+import re
+import unicodedata
+
+# Tashkeel (harakat, tanween, shadda, sukun), superscript alef and tatweel
+ARABIC_MARKS = re.compile("[\u064b-\u0652\u0670\u0640]")
+
+ARABIC_LETTERS = str.maketrans({
+    "\u0623": "\u0627",  # alef with hamza above -> alef
+    "\u0625": "\u0627",  # alef with hamza below -> alef
+    "\u0622": "\u0627",  # alef with madda -> alef
+    "\u0671": "\u0627",  # alef wasla -> alef
+    "\u0649": "\u064a",  # alef maqsura -> yaa
+    "\u0629": "\u0647",  # taa marbuta -> haa
+})
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_arabic(text):
+    return ARABIC_MARKS.sub("", text).translate(ARABIC_LETTERS)
+
+
+def normalize_search_term(value):
+    # Mirrors the products_normalize_ar() SQL function (migration 0006)
+    # applied to stored Arabic text. NFKC folds Arabic presentation forms
+    # and full-width Latin to their base letters before case folding
+    value = unicodedata.normalize("NFKC", value).casefold()
+    value = normalize_arabic(value)
+    return WHITESPACE.sub(" ", value).strip()
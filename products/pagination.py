@@ -0,0 +1,251 @@
+# products/pagination.py
+import base64
+import binascii
+import json
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .instrumentation import timing_for
+
+COUNT_CAPPED = "capped"
+COUNT_ESTIMATE = "estimate"
+
+
+def encode_cursor(position):
+    data = json.dumps(position, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+# Row ids are bigint
+ID_RANGE = range(-(2**63), 2**63)
+
+
+def decode_cursor(cursor, ranked):
+    """
+    The position a cursor encodes, with every field seek() compares on
+    checked: a bigint id and, for ranked queries, a finite relevance.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded))
+        pk = position["id"]
+        relevance = position["relevance"] if ranked else 0.0
+        # json.loads takes NaN and Infinity, and bool is an int
+        if type(pk) is not int or pk not in ID_RANGE:
+            raise ValueError(pk)
+        if type(relevance) not in (int, float):
+            raise TypeError(relevance)
+        if not math.isfinite(relevance):
+            raise ValueError(relevance)
+    except (
+        binascii.Error, ValueError, TypeError, KeyError, OverflowError
+    ):
+        raise NotFound("Invalid cursor")
+    if ranked:
+        return {"id": pk, "relevance": float(relevance)}
+    return {"id": pk}
+
+
+def is_ranked(queryset):
+    # Search filters annotate a relevance score; plain listings don't
+    return "relevance" in queryset.query.annotations
+
+
+def apply_ordering(queryset, ranked):
+    # id breaks relevance ties so every row has a unique position
+    if ranked:
+        return queryset.order_by("-relevance", "id")
+    return queryset.order_by("id")
+
+
+def seek(queryset, position, ranked):
+    # Continue strictly after the last row of the previous page instead of
+    # re-ranking and discarding the earlier rows with OFFSET
+    if ranked:
+        relevance = position["relevance"]
+        return queryset.filter(
+            Q(relevance__lt=relevance)
+            | Q(relevance=relevance, id__gt=position["id"])
+        )
+    return queryset.filter(id__gt=position["id"])
+
+
+def position_of(row, ranked):
+    get = row.get if isinstance(row, dict) else row.__getattribute__
+    position = {"id": get("id")}
+    if ranked:
+        position["relevance"] = get("relevance")
+    return position
+
+
+def estimate_count(queryset):
+    # Planner row estimate; costs a plan, not a scan
+    plan = json.loads(queryset.order_by().explain(format="json"))
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def capped_count(queryset, cap):
+    return queryset.order_by()[:cap].count()
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination ordered on (-relevance, id) for search results
+    and on id for plain listings. Pages are addressed by an opaque cursor,
+    so there is no COUNT(*) and no OFFSET; a count is only returned when
+    asked for with ?count=capped or ?count=estimate.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.prepare(queryset, request)
+        timing = timing_for(request)
+        with timing.stage("count"):
+            self.count, self.count_approximate = self.get_count(queryset)
+        with timing.stage("sql"):
+            rows = list(self.page_slice(queryset))
+        return self.finish(rows)
+
+    async def apaginate_queryset(self, queryset, request):
+        # For async views; request may be a plain Django HttpRequest
+        queryset = self.prepare(queryset, request)
+        timing = timing_for(request)
+        with timing.stage("count"):
+            self.count, self.count_approximate = await self.aget_count(
+                queryset
+            )
+        with timing.stage("sql"):
+            rows = [row async for row in self.page_slice(queryset)]
+        return self.finish(rows)
+
+    def prepare(self, queryset, request):
+        self.request = request
+        self.params = getattr(request, "query_params", request.GET)
+        self.page_size = self.get_page_size(self.params)
+        self.ranked = is_ranked(queryset)
+        return apply_ordering(queryset, self.ranked)
+
+    def page_slice(self, queryset):
+        cursor = self.params.get(self.cursor_query_param)
+        if cursor:
+            position = decode_cursor(cursor, self.ranked)
+            queryset = seek(queryset, position, self.ranked)
+        # One extra row tells us whether there is a next page
+        return queryset[: self.page_size + 1]
+
+    def finish(self, rows):
+        page = rows[: self.page_size]
+        self.next_position = None
+        if len(rows) > self.page_size:
+            self.next_position = position_of(page[-1], self.ranked)
+        return page
+
+    def get_page_size(self, params):
+        try:
+            page_size = int(params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_count(self, queryset):
+        mode = self.params.get(self.count_query_param)
+        if mode == COUNT_ESTIMATE:
+            return estimate_count(queryset), True
+        if mode == COUNT_CAPPED:
+            cap = settings.PRODUCT_SEARCH_COUNT_CAP
+            count = capped_count(queryset, cap + 1)
+            return min(count, cap), count > cap
+        return None, False
+
+    async def aget_count(self, queryset):
+        mode = self.params.get(self.count_query_param)
+        if mode == COUNT_ESTIMATE:
+            # QuerySet.explain() has no async counterpart
+            return await sync_to_async(estimate_count)(queryset), True
+        if mode == COUNT_CAPPED:
+            cap = settings.PRODUCT_SEARCH_COUNT_CAP
+            count = await queryset.order_by()[: cap + 1].acount()
+            return min(count, cap), count > cap
+        return None, False
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, encode_cursor(self.next_position)
+        )
+
+    def get_first_link(self):
+        url = self.request.build_absolute_uri()
+        return remove_query_param(url, self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return {
+            "next": self.get_next_link(),
+            "first": self.get_first_link(),
+            "count": self.count,
+            "count_approximate": self.count_approximate,
+            "results": data,
+        }
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "first": {"type": "string", "format": "uri"},
+                "count": {"type": "integer", "nullable": True},
+                "count_approximate": {"type": "boolean"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Opaque cursor taken from the 'next' link",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results to return per page",
+                "schema": {"type": "integer"},
+            },
+            {
+                "name": self.count_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Include a count: 'capped' counts up to "
+                "PRODUCT_SEARCH_COUNT_CAP rows, 'estimate' uses the "
+                "planner estimate",
+                "schema": {
+                    "type": "string",
+                    "enum": [COUNT_CAPPED, COUNT_ESTIMATE],
+                },
+            },
+        ]
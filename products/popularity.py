@@ -0,0 +1,75 @@
+# products/popularity.py
+"""
+Sampled popularity of search terms and of products, kept in Redis sorted
+sets: the warm_search_cache command precomputes the first pages of the
+most requested terms, and compute_static_scores adds the products' hits
+(barcode lookups) to Product.popularity.
+"""
+import random
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from .normalization import normalize_search_term
+
+POPULAR_SEARCHES_KEY = "product_search:popular"
+PRODUCT_HITS_KEY = "product_search:product_hits"
+
+
+def is_sampled():
+    rate = settings.PRODUCT_SEARCH_POPULARITY["SAMPLE_RATE"]
+    return bool(rate) and random.random() < rate
+
+
+def sampled_term(params):
+    """
+    The normalized term of a first-page search, for a sample of
+    PRODUCT_SEARCH_POPULARITY["SAMPLE_RATE"] of the requests; else None.
+    """
+    if not is_sampled() or params.get("cursor"):
+        return None
+    term = normalize_search_term(params.get("search", ""))
+    return term if len(term) >= 2 else None
+
+
+def record_term(term):
+    max_terms = settings.PRODUCT_SEARCH_POPULARITY["MAX_TERMS"]
+    pipe = get_redis_connection("default").pipeline(transaction=False)
+    pipe.zincrby(POPULAR_SEARCHES_KEY, 1, term)
+    # Drops the least popular terms beyond the cap, so the set stays small
+    pipe.zremrangebyrank(POPULAR_SEARCHES_KEY, 0, -(max_terms + 1))
+    pipe.execute()
+
+
+def popular_terms(count):
+    """The count most searched terms, most popular first."""
+    client = get_redis_connection("default")
+    members = client.zrevrange(POPULAR_SEARCHES_KEY, 0, count - 1)
+    return [member.decode() for member in members]
+
+
+def decay_terms(factor):
+    # Ages the counts so that yesterday's spikes give way to today's terms;
+    # terms left below one sampled search are dropped
+    client = get_redis_connection("default")
+    pipe = client.pipeline()
+    pipe.zunionstore(POPULAR_SEARCHES_KEY, {POPULAR_SEARCHES_KEY: factor})
+    pipe.zremrangebyscore(POPULAR_SEARCHES_KEY, "-inf", "(1")
+    pipe.execute()
+
+
+def record_product_hits(products):
+    """Counts a hit for each product found by a sampled request."""
+    pipe = get_redis_connection("default").pipeline(transaction=False)
+    for product in products:
+        pipe.zincrby(PRODUCT_HITS_KEY, 1, product["id"])
+    pipe.execute()
+
+
+def take_product_hits():
+    """{product id: hits} counted since the last call, which resets them."""
+    pipe = get_redis_connection("default").pipeline()
+    pipe.zrange(PRODUCT_HITS_KEY, 0, -1, withscores=True)
+    pipe.delete(PRODUCT_HITS_KEY)
+    members, _ = pipe.execute()
+    return {int(member): int(hits) for member, hits in members}
@@ -0,0 +1,165 @@
+# products/ratelimit.py
+"""
+Per-client request limits with a pluggable backend, configured by the
+PRODUCT_RATELIMIT setting.
+
+RedisRateLimiter counts every request in Redis with a single pipelined
+INCR + EXPIRE. LocalRateLimiter counts in process memory and pushes its
+counts to Redis at most every SYNC_INTERVAL seconds per client, so most
+requests make no network call at all; in exchange a client can exceed its
+limit by what the other workers admitted since their last sync.
+"""
+import re
+import threading
+import time
+from functools import lru_cache, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from django_ratelimit.exceptions import Ratelimited
+from django_redis import get_redis_connection
+
+from .instrumentation import timing_for
+
+KEY_PREFIX = "ratelimit"
+
+# "100/hour", "2000/h", "10/5m"; same syntax as django_ratelimit
+RATE_PATTERN = re.compile(r"(\d+)/(\d*)([smhd])\w*")
+PERIODS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """Returns (limit, period in seconds) for a rate string."""
+    match = RATE_PATTERN.fullmatch(rate)
+    if match is None:
+        raise ImproperlyConfigured(f"Invalid rate limit {rate!r}")
+    limit, multiplier, unit = match.groups()
+    return int(limit), int(multiplier or 1) * PERIODS[unit]
+
+
+def client_ip(request):
+    return request.META.get("REMOTE_ADDR", "")
+
+
+class RateLimiter:
+    """
+    Fixed-window counters per (group, client). Subclasses implement
+    count(), which records one request and returns the window's total.
+    """
+
+    def __init__(self, options):
+        self.alias = options.get("CACHE_ALIAS", "default")
+        self.rates = {
+            group: parse_rate(rate)
+            for group, rate in options.get("RATES", {}).items()
+        }
+
+    def is_limited(self, group, client):
+        try:
+            limit, period = self.rates[group]
+        except KeyError:
+            raise ImproperlyConfigured(f"No rate limit for group {group!r}")
+        window = int(time.time() // period)
+        key = f"{KEY_PREFIX}:{group}:{client}:{window}"
+        return self.count(key, period, (window + 1) * period) > limit
+
+    def count(self, key, period, expires_at):
+        raise NotImplementedError
+
+    def push(self, key, amount, period):
+        # One round-trip; the TTL outlives the window so it never needs
+        # to be set exactly once
+        client = get_redis_connection(self.alias)
+        pipe = client.pipeline(transaction=False)
+        pipe.incrby(key, amount)
+        pipe.expire(key, period)
+        total, _ = pipe.execute()
+        return total
+
+
+class RedisRateLimiter(RateLimiter):
+    def count(self, key, period, expires_at):
+        return self.push(key, 1, period)
+
+
+class LocalCounter:
+    __slots__ = ("synced", "pending", "synced_at", "expires_at")
+
+    def __init__(self, expires_at):
+        # Never synced, so the first request for a client goes to Redis
+        self.synced = 0
+        self.pending = 0
+        self.synced_at = float("-inf")
+        self.expires_at = expires_at
+
+
+class LocalRateLimiter(RateLimiter):
+    def __init__(self, options):
+        super().__init__(options)
+        self.sync_interval = options.get("SYNC_INTERVAL", 1.0)
+        self.max_keys = options.get("MAX_KEYS", 10000)
+        self.lock = threading.Lock()
+        self.counters = {}
+
+    def count(self, key, period, expires_at):
+        now = time.monotonic()
+        with self.lock:
+            counter = self.counters.get(key)
+            if counter is None:
+                self.prune()
+                counter = self.counters[key] = LocalCounter(expires_at)
+            counter.pending += 1
+            if now - counter.synced_at < self.sync_interval:
+                return counter.synced + counter.pending
+            pending, counter.pending = counter.pending, 0
+            counter.synced_at = now
+
+        # Outside the lock so other clients aren't held up by Redis
+        total = self.push(key, pending, period)
+        with self.lock:
+            counter.synced = max(counter.synced, total)
+            return counter.synced + counter.pending
+
+    def prune(self):
+        # Drops the counters of past windows once there are too many
+        if len(self.counters) >= self.max_keys:
+            now = time.time()
+            self.counters = {
+                key: counter
+                for key, counter in self.counters.items()
+                if counter.expires_at > now
+            }
+
+
+@lru_cache(maxsize=None)
+def get_limiter():
+    options = settings.PRODUCT_RATELIMIT
+    return import_string(options["BACKEND"])(options)
+
+
+def is_limited(request, group):
+    if not settings.RATELIMIT_ENABLE:
+        return False
+    with timing_for(request).stage("ratelimit"):
+        return get_limiter().is_limited(group, client_ip(request))
+
+
+async def ais_limited(request, group):
+    return await sync_to_async(is_limited)(request, group)
+
+
+def ratelimit(group):
+    """View decorator answering 403 once the client is over its limit."""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if is_limited(request, group):
+                raise Ratelimited()
+            return view(request, *args, **kwargs)
+
+        return wrapped
+
+    return decorator
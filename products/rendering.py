@@ -0,0 +1,77 @@
+# products/rendering.py
+"""
+Search responses are cached as their final JSON body, gzip-compressed when
+PRODUCT_SEARCH_CACHE_COMPRESSION is "gzip", so a cache hit is written out
+as is: no unpickling of nested dicts, no renderer pass and, for clients
+accepting gzip, no compression either.
+"""
+import gzip
+import json
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+# Smaller bodies don't shrink enough to be worth a Content-Encoding; same
+# cut-off as django.middleware.gzip
+GZIP_MIN_LENGTH = 200
+
+
+def render_body(data):
+    """Returns (body, encoding) for a response payload."""
+    # Same bytes DRF's JSONRenderer sends for Response(data)
+    body = JSONRenderer().render(data)
+    compression = settings.PRODUCT_SEARCH_CACHE_COMPRESSION
+    if compression == "gzip" and len(body) >= GZIP_MIN_LENGTH:
+        return gzip.compress(body, compresslevel=6, mtime=0), "gzip"
+    return body, None
+
+
+def decode_body(rendered):
+    body, encoding = rendered
+    if encoding == "gzip":
+        body = gzip.decompress(body)
+    return json.loads(body)
+
+
+def accepts_gzip(accept_encoding):
+    """
+    Whether an Accept-Encoding header accepts gzip: listed (or matched by
+    "*" when it isn't) with a q-value above 0, so "gzip;q=0" and
+    "identity, *;q=0" refuse it.
+    """
+    qualities = {}
+    for coding in accept_encoding.split(","):
+        name, *params = (part.strip() for part in coding.split(";"))
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            qualities[name.lower()] = quality
+    quality = qualities.get("gzip", qualities.get("x-gzip"))
+    if quality is None:
+        quality = qualities.get("*", 0.0)
+    return quality > 0
+
+
+def body_response(request, rendered):
+    """
+    HttpResponse sending a rendered body; compressed bodies are passed
+    through to clients that accept gzip and inflated for the others.
+    """
+    body, encoding = rendered
+    response = HttpResponse(content_type="application/json")
+    if encoding == "gzip":
+        if accepts_gzip(request.META.get("HTTP_ACCEPT_ENCODING", "")):
+            response["Content-Encoding"] = "gzip"
+        else:
+            body = gzip.decompress(body)
+        patch_vary_headers(response, ("Accept-Encoding",))
+    response.content = body
+    return response
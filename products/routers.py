@@ -0,0 +1,233 @@
+# products/routers.py
+"""
+Read replicas. ReplicaRouter spreads reads over the database aliases listed
+in PRODUCT_DB_REPLICAS["ALIASES"] and sends writes to the primary
+("default"). Reads that must see a recent write stay on the primary too:
+
+- for the rest of a request (or command, or thread) once it wrote;
+- for requests from a client whose request wrote in the last PIN_SECONDS,
+  recognised by a cookie (replica_pinning_middleware). Read-only POSTs,
+  such as batch barcode lookups, don't pin;
+- in every worker for MAX_LAG seconds after it sees a new search cache
+  generation, so that responses cached under it aren't computed from a
+  replica which hasn't replayed the change yet.
+
+Each worker measures the replication lag of the replicas every
+CHECK_INTERVAL seconds; a replica lagging by more than MAX_LAG, or not
+answering, is left out of the rotation until it catches up.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger("products.db.replicas")
+
+PIN_COOKIE = "primary_pin"
+
+# Seconds since the last replayed transaction committed on the primary, or
+# 0 when the replica replayed everything it received; the functions return
+# NULL on a server that isn't a replica, e.g. an alias of the primary
+LAG_QUERY = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END
+"""
+
+
+class Pin:
+    """
+    Whether the reads of a request must use the primary, and whether it
+    wrote. Shared by reference, so the middleware sees the writes made in
+    the threads sync_to_async runs the ORM in.
+    """
+
+    __slots__ = ("primary", "wrote")
+
+    def __init__(self, primary=False):
+        self.primary = primary
+        self.wrote = False
+
+
+# The Pin of the current request; threads outside a request (commands,
+# background threads) get their own on their first write
+current_pin = contextvars.ContextVar("replica_pin", default=None)
+
+
+class ReplicaSet:
+    """Replication lag of each replica, as last measured by this process."""
+
+    def __init__(self, options):
+        self.aliases = list(options["ALIASES"])
+        self.max_lag = options["MAX_LAG"]
+        self.interval = options["CHECK_INTERVAL"]
+        # alias -> lag in seconds, None while unreachable
+        self.lags = dict.fromkeys(self.aliases, 0.0)
+        self.checked_at = float("-inf")
+        self.lock = threading.Lock()
+        self.generation = None
+        self.primary_until = float("-inf")
+
+    def is_available(self, alias):
+        lag = self.lags[alias]
+        return lag is not None and lag <= self.max_lag
+
+    def available(self):
+        if (
+            time.monotonic() - self.checked_at >= self.interval
+            # One thread measures; the others go on with the last lags
+            and self.lock.acquire(blocking=False)
+        ):
+            try:
+                self.check()
+            finally:
+                self.lock.release()
+        return [alias for alias in self.aliases if self.is_available(alias)]
+
+    def check(self):
+        # Set first, so an unreachable replica is retried at the interval
+        # and not on every read
+        self.checked_at = time.monotonic()
+        for alias in self.aliases:
+            was_available = self.is_available(alias)
+            try:
+                with connections[alias].cursor() as cursor:
+                    cursor.execute(LAG_QUERY)
+                    self.lags[alias] = float(cursor.fetchone()[0])
+            except DatabaseError as exc:
+                self.lags[alias] = None
+                if was_available:
+                    logger.warning(
+                        "Replica %s out of rotation: %s", alias, exc
+                    )
+                continue
+            if was_available and not self.is_available(alias):
+                logger.warning(
+                    "Replica %s out of rotation: %.1fs behind",
+                    alias,
+                    self.lags[alias],
+                )
+            elif not was_available and self.is_available(alias):
+                logger.info("Replica %s back in rotation", alias)
+
+    def observe_generation(self, generation):
+        if generation != self.generation:
+            # The catalog changed: replicas may not have replayed it yet
+            self.generation = generation
+            self.primary_until = time.monotonic() + self.max_lag
+
+    def render_metrics(self):
+        lines = [
+            "# HELP product_db_replica_lag_seconds Replication lag of each "
+            "read replica as last measured by this worker; -1 when it "
+            "didn't answer.",
+            "# TYPE product_db_replica_lag_seconds gauge",
+        ]
+        for alias in self.aliases:
+            lag = self.lags[alias]
+            lines.append(
+                f'product_db_replica_lag_seconds{{alias="{alias}"}} '
+                f"{-1 if lag is None else lag}"
+            )
+        lines += [
+            "# HELP product_db_replica_available Whether this worker sends "
+            "reads to each read replica.",
+            "# TYPE product_db_replica_available gauge",
+        ]
+        for alias in self.aliases:
+            lines.append(
+                f'product_db_replica_available{{alias="{alias}"}} '
+                f"{int(self.is_available(alias))}"
+            )
+        return lines
+
+
+replicas = ReplicaSet(settings.PRODUCT_DB_REPLICAS)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        pin = current_pin.get()
+        if not replicas.aliases or (pin is not None and pin.primary):
+            return DEFAULT_DB_ALIAS
+        if time.monotonic() < replicas.primary_until:
+            return DEFAULT_DB_ALIAS
+        # Related objects are read from where their instance came from
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        available = replicas.available()
+        return random.choice(available) if available else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Later reads of this request or thread must see the write
+        pin = current_pin.get()
+        if pin is None:
+            pin = Pin()
+            current_pin.set(pin)
+        pin.primary = pin.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema by replication
+        return db == DEFAULT_DB_ALIAS
+
+
+def set_pin_cookie(pin, response):
+    # Reads from this client stay on the primary until the replicas have
+    # had time to replay whatever the request wrote
+    if replicas.aliases and pin.wrote:
+        response.set_cookie(
+            PIN_COOKIE,
+            "1",
+            max_age=settings.PRODUCT_DB_REPLICAS["PIN_SECONDS"],
+            httponly=True,
+            samesite="Lax",
+        )
+    return response
+
+
+@sync_and_async_middleware
+def replica_pinning_middleware(get_response):
+    """
+    Sends the reads of a request to the primary once it wrote, or when its
+    client wrote in the last PIN_SECONDS.
+    """
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            pin = Pin(primary=PIN_COOKIE in request.COOKIES)
+            token = current_pin.set(pin)
+            try:
+                response = await get_response(request)
+            finally:
+                current_pin.reset(token)
+            return set_pin_cookie(pin, response)
+
+    else:
+
+        def middleware(request):
+            # Worker threads serve one request after another: the pin is
+            # reset so it doesn't outlive the request
+            pin = Pin(primary=PIN_COOKIE in request.COOKIES)
+            token = current_pin.set(pin)
+            try:
+                response = get_response(request)
+            finally:
+                current_pin.reset(token)
+            return set_pin_cookie(pin, response)
+
+    return middleware
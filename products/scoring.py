@@ -0,0 +1,51 @@
+# products/scoring.py
+from django.conf import settings
+
+from .cache import get_search_generation
+from .models import Product, ScoringParameter
+
+
+def load_scoring():
+    """PRODUCT_SEARCH_SCORING with the ScoringParameter overrides applied."""
+    scoring = dict(settings.PRODUCT_SEARCH_SCORING)
+    for name, value in ScoringParameter.objects.values_list("name", "value"):
+        # Unknown names are left over from removed settings
+        if name in scoring:
+            scoring[name] = type(scoring[name])(value)
+    if scoring["STATIC_CANDIDATES"] and not static_scores_computed():
+        # Every static score is 0 until compute_static_scores runs, so the
+        # static order would keep an arbitrary slice of the matches
+        scoring["STATIC_CANDIDATES"] = False
+    return scoring
+
+
+def static_scores_computed():
+    # One row read from the static_score index; compute_static_scores
+    # bumps the cache generation, so the scoring is reloaded after a run
+    return Product.objects.filter(static_score__gt=0).exists()
+
+
+class ScoringLookup:
+    """
+    Scoring configuration of this process, reloaded when the search cache
+    generation changes; saving a ScoringParameter bumps it.
+    """
+
+    __slots__ = ("_state",)
+
+    def __init__(self):
+        self._state = (None, None)
+
+    def get(self, generation):
+        state = self._state
+        if state[0] != generation:
+            state = (generation, load_scoring())
+            self._state = state
+        return state[1]
+
+
+scoring_lookup = ScoringLookup()
+
+
+def current_scoring():
+    return scoring_lookup.get(get_search_generation())
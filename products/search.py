@@ -0,0 +1,310 @@
+# products/search.py
+import re
+
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity,
+    TrigramWordSimilarity,
+)
+from django.db.models import (
+    BigIntegerField,
+    F,
+    FloatField,
+    Q,
+    TextField,
+    Value,
+)
+from django.db.models.expressions import Expression, RawSQL
+from django.db.models.functions import Cast, Coalesce, Collate, Lower
+from django.db.models.sql.constants import INNER
+from django.db.models.sql.datastructures import Join
+
+# Text search configuration shared by the stored vectors and the queries
+SEARCH_CONFIG = "simple"
+
+# EAN-8, UPC-A, EAN-13 and GTIN-14 codes. ASCII digits only: \d would also
+# take Arabic-Indic and other Unicode digits, which no stored barcode has
+BARCODE_PATTERN = re.compile(r"[0-9]{8}|[0-9]{12,14}", re.ASCII)
+
+ARABIC_PATTERN = re.compile("[\u0600-\u06ff]")
+
+
+def is_barcode(value):
+    return BARCODE_PATTERN.fullmatch(value) is not None
+
+
+def stored_rank(vector_field, search_query):
+    # Rank against a stored vector column; rows whose vector has not been
+    # built yet rank as 0 instead of NULL
+    return Coalesce(
+        SearchRank(F(vector_field), search_query),
+        Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def annotate_relevance(queryset, value, search_query, scoring):
+    return queryset.annotate(
+        ft_rank_en=stored_rank("search_vector_en", search_query),
+        ft_rank_ar=stored_rank("search_vector_ar", search_query),
+        fuzzy_name_en=TrigramSimilarity("name_en", value),
+        fuzzy_name_ar=TrigramSimilarity("name_ar_normalized", value),
+        # Best match of the query against any word run of the paragraph,
+        # rather than against the whole paragraph
+        fuzzy_desc_en=TrigramWordSimilarity(value, "description_en"),
+        fuzzy_desc_ar=TrigramWordSimilarity(value, "description_ar"),
+        relevance=(
+            (F("ft_rank_en") + F("ft_rank_ar")) * scoring["FULLTEXT_WEIGHT"]
+            + (F("fuzzy_name_en") + F("fuzzy_name_ar"))
+            * scoring["NAME_WEIGHT"]
+            + (F("fuzzy_desc_en") + F("fuzzy_desc_ar"))
+            * scoring["DESCRIPTION_WEIGHT"]
+            + F("static_score") * scoring["STATIC_WEIGHT"]
+        ),
+    )
+
+
+def legacy_search(queryset, value, scoring):
+    # Scores every row, then filters on the computed scores
+    search_query = SearchQuery(value, config=SEARCH_CONFIG)
+    queryset = annotate_relevance(queryset, value, search_query, scoring)
+
+    fulltext_cutoff = scoring["FULLTEXT_CUTOFF"]
+    name_cutoff = scoring["NAME_CUTOFF"]
+    return queryset.filter(
+        Q(ft_rank_en__gt=fulltext_cutoff)
+        | Q(ft_rank_ar__gt=fulltext_cutoff)
+        | Q(fuzzy_name_en__gt=name_cutoff)
+        | Q(fuzzy_name_ar__gt=name_cutoff)
+        | Q(name_en__icontains=value)  # Fallback partial match
+        | Q(name_ar_normalized__icontains=value)  # Fallback partial match
+    ).order_by("-relevance")
+
+
+def limit_candidates(matches, limit, scoring):
+    """
+    Ids of at most limit of the matching rows: the first ones the bitmap
+    scan returns or, with STATIC_CANDIDATES, the highest static scores
+    among the first STATIC_SCAN_FACTOR * limit of them. Ordering every
+    match by static_score would read the whole match set (or walk the
+    static_score index and filter row by row), so the scan is capped in a
+    derived table, which Postgres can't flatten into the ORDER BY.
+    """
+    if not scoring["STATIC_CANDIDATES"]:
+        return matches.values("id")[:limit]
+    scanned = matches.values("id", "static_score")[
+        : limit * scoring["STATIC_SCAN_FACTOR"]
+    ]
+    sql, params = scanned.query.sql_with_params()
+    return RawSQL(
+        f"SELECT id FROM ({sql}) AS scanned "
+        "ORDER BY static_score DESC LIMIT %s",
+        (*params, limit),
+    )
+
+
+def candidate_ids(queryset, value, search_query, limit, scoring):
+    # Every branch is an indexed operator so Postgres can answer the OR
+    # with a BitmapOr over the GIN/btree indexes
+    matches = queryset.filter(
+        Q(search_vector_en=search_query)
+        | Q(search_vector_ar=search_query)
+        | Q(name_en__trigram_similar=value)
+        | Q(name_ar_normalized__trigram_similar=value)
+        | Q(description_en__trigram_word_similar=value)
+        | Q(description_ar__trigram_word_similar=value)
+        | Q(barcode=value)
+    )
+    return limit_candidates(matches, limit, scoring)
+
+
+def candidate_search(queryset, value, limit, scoring):
+    # Two phases: bounded candidate retrieval, then full scoring over the
+    # candidates only
+    search_query = SearchQuery(value, config=SEARCH_CONFIG)
+    queryset = queryset.filter(
+        id__in=candidate_ids(queryset, value, search_query, limit, scoring)
+    )
+
+    return annotate_relevance(
+        queryset, value, search_query, scoring
+    ).order_by("-relevance")
+
+
+def document_search(queryset, value, limit, scoring):
+    """
+    Search over ProductSearchDocument rows: one combined vector that also
+    holds brand and category names, so "nestle milk" matches a Nestle
+    product, plus trigram similarity on the names. Same two phases as
+    candidate_search when limit is set.
+    """
+    search_query = SearchQuery(value, config=SEARCH_CONFIG)
+    matches = (
+        Q(document=search_query)
+        | Q(name_en__trigram_similar=value)
+        | Q(name_ar_normalized__trigram_similar=value)
+        | Q(barcode=value)
+    )
+    if limit:
+        candidates = limit_candidates(queryset.filter(matches), limit, scoring)
+        queryset = queryset.filter(id__in=candidates)
+    else:
+        queryset = queryset.filter(matches)
+
+    return queryset.annotate(
+        ft_rank=stored_rank("document", search_query),
+        fuzzy_name_en=TrigramSimilarity("name_en", value),
+        fuzzy_name_ar=TrigramSimilarity("name_ar_normalized", value),
+        relevance=(
+            F("ft_rank") * scoring["FULLTEXT_WEIGHT"]
+            + (F("fuzzy_name_en") + F("fuzzy_name_ar"))
+            * scoring["NAME_WEIGHT"]
+            + F("static_score") * scoring["STATIC_WEIGHT"]
+        ),
+    ).order_by("-relevance")
+
+
+class RankedJoin(Join):
+    """
+    Joins the rows of a table to ids ranked outside the database, with the
+    relevance computed for each one and its position in the ranking:
+
+        INNER JOIN unnest(ids, relevance) WITH ORDINALITY
+            AS ranked (id, relevance, position) ON ranked.id = table.id
+
+    Postgres hashes (or merges) the join, instead of searching the array for
+    each row's id, which is quadratic in the number of ids.
+    """
+
+    columns = ("id", "relevance", "position")
+
+    def __init__(
+        self, parent_alias, ids, relevance, table_alias=None, join_type=INNER
+    ):
+        self.table_name = "ranked"
+        self.parent_alias = parent_alias
+        self.table_alias = table_alias
+        self.join_type = join_type
+        self.join_field = None
+        self.nullable = False
+        self.filtered_relation = None
+        self.ids = ids
+        self.relevance = relevance
+
+    def as_sql(self, compiler, connection):
+        alias = compiler.quote_name_unless_alias(self.table_alias)
+        parent = compiler.quote_name_unless_alias(self.parent_alias)
+        columns = ", ".join(map(connection.ops.quote_name, self.columns))
+        sql = (
+            f"{self.join_type} unnest(%s::bigint[], %s::double precision[]) "
+            f"WITH ORDINALITY AS {alias} ({columns}) "
+            f'ON {alias}."id" = {parent}."id"'
+        )
+        return sql, [self.ids, self.relevance]
+
+    def relabeled_clone(self, change_map):
+        return self.__class__(
+            change_map.get(self.parent_alias, self.parent_alias),
+            self.ids,
+            self.relevance,
+            change_map.get(self.table_alias, self.table_alias),
+            self.join_type,
+        )
+
+    @property
+    def identity(self):
+        # A join without an alias yet matches none, so Query.join() never
+        # reuses one made for another list of ids
+        return self.__class__, self.parent_alias, self.table_alias
+
+
+class RankedColumn(Expression):
+    """A column of a RankedJoin."""
+
+    def __init__(self, alias, name, output_field):
+        super().__init__(output_field=output_field)
+        self.alias = alias
+        self.name = name
+
+    def as_sql(self, compiler, connection):
+        alias = compiler.quote_name_unless_alias(self.alias)
+        return f"{alias}.{connection.ops.quote_name(self.name)}", []
+
+    def relabeled_clone(self, change_map):
+        return self.__class__(
+            change_map.get(self.alias, self.alias),
+            self.name,
+            self.output_field,
+        )
+
+    def get_group_by_cols(self):
+        return [self]
+
+
+def ranked_ids(queryset, ids, relevance):
+    """
+    Rows of queryset with the given ids, in the given order, annotated
+    with the relevance computed for each one outside the database
+    (products.memory_index), so the keyset pagination and facets work as
+    for the other searches.
+    """
+    queryset = queryset.all()
+    query = queryset.query
+    alias = query.join(
+        RankedJoin(query.get_initial_alias(), ids, relevance)
+    )
+    return queryset.annotate(
+        relevance=RankedColumn(alias, "relevance", FloatField()),
+    ).order_by(RankedColumn(alias, "position", BigIntegerField()))
+
+
+def suggest_name_key(field):
+    # The name in the C collation, lower-cased for name_en, exactly as
+    # name_en_c_prefix_idx / name_ar_norm_c_prefix_idx index it: a btree
+    # in the C collation serves both the LIKE 'abc%' range and the order
+    if field == "name_en":
+        return Collate(Lower(field), "C")
+    return Collate(Cast(field, TextField()), "C")
+
+
+def suggest_names(queryset, prefix, limit):
+    """
+    Name completions for an already normalized prefix. Prefix matches are
+    read from the C-collated name indexes in index order, one row per
+    distinct name, so a query reads about limit rows however many names
+    share the prefix; short lists are topped up with trigram matches so
+    typos still get suggestions.
+    """
+    if ARABIC_PATTERN.search(prefix):
+        field = "name_ar_normalized"
+    else:
+        field = "name_en"
+    queryset = queryset.annotate(name_key=suggest_name_key(field))
+
+    suggestions = list(
+        queryset.filter(name_key__startswith=prefix)
+        .order_by("name_key", "id")
+        .distinct("name_key")
+        .values("id", "name_en", "name_ar", "name_key")[:limit]
+    )
+
+    if len(suggestions) < limit and len(prefix) >= 3:
+        seen = {row["name_key"] for row in suggestions}
+        fuzzy = (
+            queryset.filter(**{f"{field}__trigram_similar": prefix})
+            .annotate(similarity=TrigramSimilarity(field, prefix))
+            .order_by("-similarity", "id")
+            .values("id", "name_en", "name_ar", "name_key")[: limit * 3]
+        )
+        for row in fuzzy:
+            if len(suggestions) == limit:
+                break
+            if row["name_key"] not in seen:
+                seen.add(row["name_key"])
+                suggestions.append(row)
+
+    return [
+        {"id": row["id"], "name_en": row["name_en"], "name_ar": row["name_ar"]}
+        for row in suggestions
+    ]
@@ -1,7 +1,27 @@
 # products/serializers.py
+import json
+
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 
-from .models import Brand, Category, Product
+from .models import Brand, Category, Product, ProductSearchDocument
+
+# Columns read for list responses; the tsvector columns are never fetched
+PRODUCT_LIST_FIELDS = (
+    "id",
+    "brand_id",
+    "category_id",
+    "name_en",
+    "name_ar",
+    "description_en",
+    "description_ar",
+    "barcode",
+    "calories",
+    "protein",
+    "created_at",
+    "updated_at",
+)
 
 
 class BrandSerializer(serializers.ModelSerializer):
@@ -22,4 +42,126 @@ class ProductSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Product
-        fields = "__all__"
+        exclude = [
+            "search_vector_en",
+            "search_vector_ar",
+            "name_ar_normalized",
+            "popularity",
+            "static_score",
+        ]
+
+
+class ProductSuggestionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Product
+        fields = ["id", "name_en", "name_ar"]
+
+
+class SuggestQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=100, trim_whitespace=False)
+    limit = serializers.IntegerField(min_value=1, max_value=20, default=10)
+
+
+class BarcodeBatchSerializer(serializers.Serializer):
+    barcodes = serializers.ListField(
+        child=serializers.CharField(max_length=100),
+        allow_empty=False,
+        max_length=settings.PRODUCT_BARCODE_BATCH_LIMIT,
+    )
+
+
+class RelatedLookup:
+    """
+    Brand and category dicts shared by every row of every response in this
+    process, reloaded when the search cache generation changes.
+    """
+
+    __slots__ = ("_state",)
+
+    def __init__(self):
+        self._state = (None, {}, {})
+
+    def get(self, generation):
+        state = self._state
+        if state[0] != generation:
+            state = (generation, _load(Brand), _load(Category))
+            # Swapped in one assignment so concurrent readers never see a
+            # half-built table
+            self._state = state
+        return state[1], state[2]
+
+
+related_lookup = RelatedLookup()
+
+
+class ProductListEncoder:
+    """
+    Hand-written equivalent of ProductSerializer for rows fetched with
+    .values(*PRODUCT_LIST_FIELDS).
+    """
+
+    __slots__ = ("brands", "categories", "tz")
+
+    fields = PRODUCT_LIST_FIELDS
+
+    def __init__(self, brands, categories):
+        self.brands = brands
+        self.categories = categories
+        self.tz = timezone.get_current_timezone()
+
+    def encode(self, row):
+        return {
+            "id": row["id"],
+            "brand": self.brands.get(row["brand_id"]),
+            "category": self.categories.get(row["category_id"]),
+            "name_en": row["name_en"],
+            "name_ar": row["name_ar"],
+            "description_en": row["description_en"],
+            "description_ar": row["description_ar"],
+            "barcode": row["barcode"],
+            "calories": row["calories"],
+            "protein": row["protein"],
+            "created_at": self.format_datetime(row["created_at"]),
+            "updated_at": self.format_datetime(row["updated_at"]),
+        }
+
+    def encode_many(self, rows):
+        encode = self.encode
+        return [encode(row) for row in rows]
+
+    def format_datetime(self, value):
+        # Same output as DRF's DateTimeField
+        value = value.astimezone(self.tz).isoformat()
+        if value.endswith("+00:00"):
+            value = value[:-6] + "Z"
+        return value
+
+
+class DocumentPayloadEncoder:
+    """
+    Encoder for ProductSearchDocument rows, whose list representation was
+    already rendered by the database.
+    """
+
+    __slots__ = ()
+
+    fields = ("id", "payload")
+
+    def encode(self, row):
+        return json.loads(row["payload"])
+
+    def encode_many(self, rows):
+        return [json.loads(row["payload"]) for row in rows]
+
+
+def list_encoder(model, brands, categories):
+    if model is ProductSearchDocument:
+        return DocumentPayloadEncoder()
+    return ProductListEncoder(brands, categories)
+
+
+def _load(model):
+    return {
+        row["id"]: row
+        for row in model.objects.values("id", "name_en", "name_ar", "slug")
+    }
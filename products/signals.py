@@ -1,14 +1,23 @@
-from django.contrib.postgres.search import SearchVector
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from .models import Product
+from .cache import bump_search_generation
+from .models import Brand, Category, Product, ScoringParameter
+
+# Product search vectors are maintained by a database trigger (migration
+# 0003), so saves need no follow-up UPDATE here
 
 
 @receiver(post_save, sender=Product)
-def update_search_vectors(sender, instance, **kwargs):
-    # Update English search vector
-    sender.objects.filter(pk=instance.pk).update(
-        search_vector_en=SearchVector("name_en", "description_en"),
-        search_vector_ar=SearchVector("name_ar", "description_ar"),
-    )
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=ScoringParameter)
+@receiver(post_delete, sender=ScoringParameter)
+def invalidate_search_cache(sender, **kwargs):
+    # Bump after commit so no request caches pre-commit data under the new
+    # generation
+    transaction.on_commit(bump_search_generation)
@@ -0,0 +1,560 @@
+# products/tests.py
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+
+from products.benchmarks import ARABIC_CORPUS
+from products.cache import search_cache_key
+from products.facets import compute_facets, facets_approximate
+from products.filters import ProductDocumentFilter, ProductSearchFilter
+from products.memory_index import build_index, refresh_index
+from products.models import Brand, Category, Product, ProductSearchDocument
+from products.normalization import normalize_search_term
+from products.pagination import apply_ordering, decode_cursor, encode_cursor
+from products.ratelimit import LocalRateLimiter, get_limiter
+from products.rendering import accepts_gzip
+from products.routers import (
+    PIN_COOKIE,
+    ReplicaRouter,
+    replica_pinning_middleware,
+    replicas,
+)
+from products.scoring import load_scoring
+from products.serializers import (
+    PRODUCT_LIST_FIELDS,
+    DocumentPayloadEncoder,
+    ProductListEncoder,
+)
+from products.search import (
+    document_search,
+    is_barcode,
+    ranked_ids,
+    suggest_name_key,
+    suggest_names,
+)
+
+# The search cache generation lives in local memory, so the tests don't
+# need Redis
+LOCAL_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "tests-default",
+    },
+    "ratelimit": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "tests-ratelimit",
+    },
+}
+
+PRODUCTS = [
+    ("Full Cream Milk", "حليب كامل الدسم", "Fresh cow milk"),
+    ("Low Fat Milk", "حليب قليل الدسم", "Skimmed milk, 1.5% fat"),
+    ("Orange Juice", "عصير برتقال", "Freshly squeezed oranges"),
+    ("Cheddar Cheese", "جبنة شيدر", "Aged cheddar made from milk"),
+    ("Natural Honey", "عسل طبيعي", "Mountain flower honey"),
+]
+
+
+def index_plan(queryset):
+    # The test tables are small enough that Postgres would scan them
+    # sequentially; with seq scans disabled the plan shows the indexes the
+    # query can use. SET LOCAL ends with the test's transaction
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+    return queryset.explain()
+
+
+def create_products():
+    brand = Brand.objects.create(
+        name_en="Almarai", name_ar="المراعي", slug="almarai"
+    )
+    category = Category.objects.create(
+        name_en="Dairy", name_ar="ألبان", slug="dairy"
+    )
+    for number, (name_en, name_ar, description) in enumerate(PRODUCTS):
+        Product.objects.create(
+            name_en=name_en,
+            name_ar=name_ar,
+            description_en=description,
+            barcode=f"62210000000{number:02d}",
+            brand=brand,
+            category=category,
+        )
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class SearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_products()
+
+    def search(self, filterset, **params):
+        queryset = filterset.Meta.model.objects.all()
+        return filterset(params, queryset=queryset).qs
+
+
+class SearchIndexTests(SearchTestCase):
+    """The querysets the filters emit are answered from the indexes."""
+
+    def test_fulltext_uses_search_vector_indexes(self):
+        plan = index_plan(self.search(ProductSearchFilter, fulltext="milk"))
+        self.assertIn("products_pr_search__3ff5ab_gin", plan)
+        self.assertIn("products_pr_search__a6b1c2_gin", plan)
+        self.assertNotIn("Seq Scan on products_product", plan)
+
+    def test_search_candidates_use_indexes(self):
+        plan = index_plan(self.search(ProductSearchFilter, search="milk"))
+        self.assertIn("products_pr_search__3ff5ab_gin", plan)
+        self.assertIn("name_en_trgm_idx", plan)
+        self.assertIn("description_en_trgm_idx", plan)
+        self.assertNotIn("Seq Scan on products_product", plan)
+
+    def test_document_search_uses_document_index(self):
+        plan = index_plan(self.search(ProductDocumentFilter, search="milk"))
+        self.assertIn("products_pr_documen_eb9ed7_gin", plan)
+        self.assertIn("document_name_en_trgm_idx", plan)
+        self.assertNotIn("Seq Scan on products_productsearchdocument", plan)
+
+    def test_static_candidates_scan_is_bounded(self):
+        scoring = dict(settings.PRODUCT_SEARCH_SCORING, STATIC_CANDIDATES=True)
+        queryset = document_search(
+            ProductSearchDocument.objects.all(), "milk", 1000, scoring
+        )
+        plan = index_plan(queryset)
+        # The matches come from the GIN scan under a LIMIT, never from a
+        # walk of the static_score index
+        self.assertIn("products_pr_documen_eb9ed7_gin", plan)
+        self.assertNotIn("document_static_score_idx", plan)
+        self.assertGreaterEqual(plan.count("Limit"), 2)
+
+    def test_static_candidates_wait_for_computed_scores(self):
+        scoring = dict(settings.PRODUCT_SEARCH_SCORING, STATIC_CANDIDATES=True)
+        with override_settings(PRODUCT_SEARCH_SCORING=scoring):
+            self.assertFalse(load_scoring()["STATIC_CANDIDATES"])
+            Product.objects.update(static_score=0.5)
+            self.assertTrue(load_scoring()["STATIC_CANDIDATES"])
+
+    def test_suggestions_read_the_prefix_index_in_order(self):
+        for field, prefix, index in (
+            ("name_en", "mi", "name_en_c_prefix_idx"),
+            ("name_ar_normalized", "حل", "name_ar_norm_c_prefix_idx"),
+        ):
+            with self.subTest(field=field):
+                queryset = (
+                    Product.objects.annotate(name_key=suggest_name_key(field))
+                    .filter(name_key__startswith=prefix)
+                    .order_by("name_key", "id")
+                    .distinct("name_key")
+                    .values("id", "name_key")[:10]
+                )
+                plan = index_plan(queryset)
+                self.assertIn(index, plan)
+                # The index order is the DISTINCT ON order: no sort
+                self.assertNotIn("Sort", plan)
+
+    def test_suggestions(self):
+        names = [row["name_en"] for row in suggest_names(
+            Product.objects.all(), "low", 10
+        )]
+        self.assertEqual(names, ["Low Fat Milk"])
+        # Code point order, as in the C collation
+        names = [row["name_ar"] for row in suggest_names(
+            Product.objects.all(), "حليب", 10
+        )]
+        self.assertEqual(names, sorted(["حليب كامل الدسم", "حليب قليل الدسم"]))
+
+    def test_suggestions_topped_up_with_trigram_matches(self):
+        # No name starts with the misspelt prefix
+        names = [row["name_en"] for row in suggest_names(
+            Product.objects.all(), "chedar chese", 10
+        )]
+        self.assertEqual(names, ["Cheddar Cheese"])
+
+    def test_fulltext_ranks_stored_vectors(self):
+        names = list(
+            self.search(ProductSearchFilter, fulltext="milk")
+            .values_list("name_en", flat=True)
+        )
+        # Names carry weight A, descriptions weight B
+        self.assertEqual(
+            sorted(names[:2]), ["Full Cream Milk", "Low Fat Milk"]
+        )
+        self.assertIn("Cheddar Cheese", names)
+        self.assertNotIn("Orange Juice", names)
+
+
+class FacetTests(SearchTestCase):
+    """Facets say when they only count the search candidates."""
+
+    def facets(self, **params):
+        facets = compute_facets(
+            self.search(ProductSearchFilter, **params), {}, {}
+        )
+        return facets, facets_approximate(params, facets)
+
+    def test_all_matches_counted(self):
+        facets, approximate = self.facets(search="milk")
+        self.assertGreater(facets["brand"][0]["count"], 1)
+        self.assertFalse(approximate)
+
+    @override_settings(PRODUCT_SEARCH_CANDIDATE_LIMIT=1)
+    def test_candidates_counted(self):
+        facets, approximate = self.facets(search="milk")
+        self.assertEqual(facets["brand"][0]["count"], 1)
+        self.assertTrue(approximate)
+
+
+class SearchDocumentTests(SearchTestCase):
+    """The triggers keep documents in step, and only rebuild when needed."""
+
+    def document_versions(self):
+        # ctid moves whenever a row is rewritten, even in one transaction
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT id, ctid::text FROM products_productsearchdocument"
+            )
+            return dict(cursor.fetchall())
+
+    def test_payload_matches_the_list_encoder(self):
+        Product.objects.update(calories=120.0, protein=3.5)
+        brands, categories = (
+            {row["id"]: row for row in model.objects.values(
+                "id", "name_en", "name_ar", "slug"
+            )}
+            for model in (Brand, Category)
+        )
+        encoder = ProductListEncoder(brands, categories)
+        rows = Product.objects.order_by("id").values(*PRODUCT_LIST_FIELDS)
+        documents = ProductSearchDocument.objects.order_by("id").values(
+            *DocumentPayloadEncoder.fields
+        )
+        # Rendered, so 120 and 120.0 differ
+        render = JSONRenderer().render
+        self.assertEqual(
+            render(DocumentPayloadEncoder().encode_many(documents)),
+            render(encoder.encode_many(rows)),
+        )
+
+    def test_unsearched_columns_leave_documents_alone(self):
+        versions = self.document_versions()
+        Product.objects.update(popularity=5)
+        self.assertEqual(self.document_versions(), versions)
+
+    def test_static_score_is_copied(self):
+        Product.objects.update(static_score=0.5)
+        self.assertEqual(
+            set(ProductSearchDocument.objects.values_list(
+                "static_score", flat=True
+            )),
+            {0.5},
+        )
+
+    def test_searched_columns_rebuild_documents(self):
+        product = Product.objects.order_by("id").first()
+        Product.objects.filter(id=product.id).update(name_en="Date Syrup")
+        document = ProductSearchDocument.objects.get(id=product.id)
+        self.assertEqual(document.name_en, "Date Syrup")
+        self.assertEqual(
+            json.loads(document.payload)["name_en"], "Date Syrup"
+        )
+        self.assertTrue(
+            self.search(ProductDocumentFilter, fulltext="syrup").exists()
+        )
+
+
+class ArabicNormalizationTests(SearchTestCase):
+    """Write-time (SQL) and query-time (Python) folding agree."""
+
+    def test_corpus_folds_alike(self):
+        with connection.cursor() as cursor:
+            for text, expected in ARABIC_CORPUS:
+                with self.subTest(text=text):
+                    cursor.execute("SELECT products_normalize_ar(%s)", [text])
+                    self.assertEqual(cursor.fetchone()[0], expected)
+                    self.assertEqual(normalize_search_term(text), expected)
+
+    def test_variants_find_the_stored_name(self):
+        # Stored as "حليب"; tashkeel and presentation forms fold to it
+        for variant in ("ح\u064eل\u0650يب", "\ufea3\ufee0\ufef4\ufe90"):
+            with self.subTest(variant=variant):
+                matches = self.search(ProductSearchFilter, fulltext=variant)
+                self.assertEqual(matches.count(), 2)
+
+
+class MemoryIndexParityTests(SearchTestCase):
+    """The in-memory index ranks like document_search."""
+
+    # Matched by the document vector, by trigram similarity (typo) and in
+    # Arabic
+    TERMS = [
+        "milk", "cheese", "orange juice", "almarai", "chedar cheese", "حليب"
+    ]
+
+    def test_same_ranked_ids(self):
+        documents = ProductSearchDocument.objects.all()
+        index = build_index()
+        scoring = load_scoring()
+        # Limits above the number of matches: below it, Postgres keeps the
+        # first matches its scan returns and the index the best ranked ones
+        for limit in (settings.PRODUCT_SEARCH_CANDIDATE_LIMIT, 0):
+            for term in self.TERMS:
+                with self.subTest(term=term, limit=limit):
+                    value = normalize_search_term(term)
+                    expected = list(apply_ordering(
+                        document_search(documents, value, limit, scoring),
+                        True,
+                    ).values_list("id", flat=True))
+                    ids, relevance = index.search(value, scoring, limit, {})
+                    self.assertTrue(expected)
+                    self.assertEqual(ids.tolist(), expected)
+                    # And in the same order once joined back to the rows
+                    hydrated = ranked_ids(
+                        documents, ids.tolist(), relevance.tolist()
+                    )
+                    self.assertEqual(
+                        list(hydrated.values_list("id", flat=True)), expected
+                    )
+
+
+class SearchCacheKeyTests(SimpleTestCase):
+    """Cached bodies are shared only where their links are right."""
+
+    def key(self, path, host="testserver", **extra):
+        request = RequestFactory().get(path, HTTP_HOST=host, **extra)
+        return search_cache_key(1, request)
+
+    def test_equivalent_queries_share_a_key(self):
+        self.assertEqual(
+            self.key("/api/products/?search=Milk&page_size=10"),
+            self.key("/api/products/?page_size=10&search=milk%20"),
+        )
+
+    def test_links_are_part_of_the_key(self):
+        key = self.key("/api/products/?search=milk")
+        self.assertNotEqual(key, self.key("/api/products/async/?search=milk"))
+        self.assertNotEqual(
+            key, self.key("/api/products/?search=milk", host="localhost")
+        )
+        self.assertNotEqual(
+            key, self.key("/api/products/?search=milk", secure=True)
+        )
+
+
+class CursorTests(SimpleTestCase):
+    """Cursors that can't be seeked on are a 404, never a 500."""
+
+    def test_valid_cursors(self):
+        cursor = encode_cursor({"id": 5, "relevance": 0.25})
+        self.assertEqual(
+            decode_cursor(cursor, True), {"id": 5, "relevance": 0.25}
+        )
+        self.assertEqual(decode_cursor(cursor, False), {"id": 5})
+
+    def test_invalid_cursors(self):
+        for position, ranked in (
+            ({"id": 5}, True),
+            ({"id": 5, "relevance": "x"}, True),
+            ({"id": 5, "relevance": None}, True),
+            ({"id": 5, "relevance": float("nan")}, True),
+            ({"id": 5, "relevance": 10**400}, True),
+            ({"id": float("inf")}, False),
+            ({"id": "5"}, False),
+            ({"id": True}, False),
+            ({"id": 2**63}, False),
+            ([5], False),
+        ):
+            with self.subTest(position=position, ranked=ranked):
+                with self.assertRaises(NotFound):
+                    decode_cursor(encode_cursor(position), ranked)
+        for cursor in ("not base64!", encode_cursor("x")[:-1]):
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(NotFound):
+                    decode_cursor(cursor, False)
+
+
+class LocalRateLimiterTests(SimpleTestCase):
+    """Checks within the sync interval are answered without Redis."""
+
+    def test_default_backend(self):
+        self.assertIsInstance(get_limiter(), LocalRateLimiter)
+
+    def test_counts_locally_between_syncs(self):
+        limiter = LocalRateLimiter(
+            {"RATES": {"search": "3/hour"}, "SYNC_INTERVAL": 60}
+        )
+        with mock.patch.object(
+            limiter, "push", side_effect=lambda key, amount, period: amount
+        ) as push:
+            limited = [
+                limiter.is_limited("search", "10.0.0.1") for _ in range(5)
+            ]
+        self.assertEqual(limited, [False, False, False, True, True])
+        self.assertEqual(push.call_count, 1)
+
+
+class AcceptEncodingTests(SimpleTestCase):
+    def test_q_values(self):
+        for header, expected in (
+            ("gzip", True),
+            ("gzip, deflate, br", True),
+            ("br;q=1.0, gzip;q=0.8", True),
+            ("*", True),
+            ("GZIP", True),
+            ("", False),
+            ("deflate, br", False),
+            ("gzip;q=0", False),
+            ("gzip; q=0.000", False),
+            ("identity, *;q=0", False),
+            ("*;q=0.5, gzip;q=0", False),
+            ("gzip;q=x", False),
+        ):
+            with self.subTest(header=header):
+                self.assertIs(accepts_gzip(header), expected)
+
+
+class BarcodeTests(SimpleTestCase):
+    """Only ASCII digit runs skip ranking as barcodes."""
+
+    def test_only_ascii_digits(self):
+        self.assertTrue(is_barcode("6221000000001"))
+        self.assertTrue(is_barcode("62210001"))
+        # Arabic-Indic and full-width digits match \d, but no barcode
+        self.assertFalse(is_barcode("\u0666\u0662\u0662\u0661" * 2))
+        self.assertFalse(is_barcode("\uff16\uff12\uff12\uff11" * 2))
+        self.assertFalse(is_barcode("622100000"))
+
+
+class ReplicaPinningTests(SimpleTestCase):
+    """Reads leave the replicas only after an actual write."""
+
+    def setUp(self):
+        for name, value in (
+            ("aliases", ["replica1"]),
+            ("available", lambda: ["replica1"]),
+            ("primary_until", float("-inf")),
+        ):
+            patcher = mock.patch.object(replicas, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.router = ReplicaRouter()
+
+    def respond(self, view, **cookies):
+        request = RequestFactory().post("/api/products/barcode/")
+        request.COOKIES.update(cookies)
+        self.reads = []
+        return replica_pinning_middleware(view)(request)
+
+    def read(self, request):
+        self.reads.append(self.router.db_for_read(Product))
+        return HttpResponse()
+
+    def test_read_only_post_stays_on_replicas(self):
+        response = self.respond(self.read)
+        self.assertEqual(self.reads, ["replica1"])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_write_pins_the_request_and_the_client(self):
+        def view(request):
+            self.read(request)
+            self.router.db_for_write(Product)
+            return self.read(request)
+
+        response = self.respond(view)
+        self.assertEqual(self.reads, ["replica1", "default"])
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_pin_cookie_sends_reads_to_the_primary(self):
+        self.respond(self.read, **{PIN_COOKIE: "1"})
+        self.assertEqual(self.reads, ["default"])
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class MemoryIndexRefreshTests(TransactionTestCase):
+    """Refreshes see every committed write, whatever the commit order."""
+
+    def setUp(self):
+        create_products()
+
+    def rename(self, product, name):
+        Product.objects.filter(id=product.id).update(name_en=name)
+
+    def assertFinds(self, index, term, product):
+        ids, _ = index.search(term, load_scoring(), 0, {})
+        self.assertIn(product.id, ids.tolist())
+
+    def test_transaction_committing_late_is_read(self):
+        first, second, third = Product.objects.order_by("id")[:3]
+        index = build_index()
+
+        # Writes first, commits after two refreshes and other commits
+        other = connections.create_connection(DEFAULT_DB_ALIAS)
+        self.addCleanup(other.close)
+        other.set_autocommit(False)
+        with other.cursor() as cursor:
+            cursor.execute(
+                "UPDATE products_product SET name_en = %s WHERE id = %s",
+                ["Saffron Yogurt", first.id],
+            )
+
+        self.rename(second, "Pistachio Spread")
+        index = refresh_index(index)
+        self.rename(third, "Mango Nectar")
+        index = refresh_index(index)
+        other.commit()
+        index = refresh_index(index)
+
+        self.assertFinds(index, "saffron", first)
+        self.assertFinds(index, "pistachio", second)
+        self.assertFinds(index, "mango", third)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class ImportProductsTests(TestCase):
+    """Invalid lines are skipped and reported, the rest imported."""
+
+    def import_lines(self, lines):
+        with tempfile.NamedTemporaryFile(
+            "w", suffix=".jsonl", encoding="utf-8", delete=False
+        ) as feed:
+            feed.write("\n".join(lines))
+        self.addCleanup(os.remove, feed.name)
+        stdout, stderr = StringIO(), StringIO()
+        call_command(
+            "import_products", feed.name, stdout=stdout, stderr=stderr
+        )
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_invalid_lines_are_skipped(self):
+        stdout, stderr = self.import_lines([
+            json.dumps({
+                "barcode": "6221000000100",
+                "name_en": "Dates",
+                "name_ar": "تمر",
+            }),
+            "{not json",
+            "[1, 2]",
+            json.dumps({"barcode": "6221000000101", "name_en": "No Arabic"}),
+        ])
+        self.assertIn("1 inserted, 0 updated, 3 skipped", stdout)
+        self.assertIn("Skipped line 2: not a JSON object", stderr)
+        self.assertIn("Skipped line 3: not a JSON object", stderr)
+        self.assertIn("Skipped line 4: missing or invalid fields", stderr)
+        self.assertTrue(
+            Product.objects.filter(barcode="6221000000100").exists()
+        )
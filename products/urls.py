@@ -4,4 +4,29 @@ from products import views
 
 urlpatterns = [
     path("products/", views.ProductAPIView.as_view(), name="product-list"),
+    path(
+        "products/async/",
+        views.ProductSearchAsyncView.as_view(),
+        name="product-list-async",
+    ),
+    path(
+        "products/metrics/",
+        views.ProductSearchMetricsView.as_view(),
+        name="product-search-metrics",
+    ),
+    path(
+        "products/suggest/",
+        views.ProductSuggestAPIView.as_view(),
+        name="product-suggest",
+    ),
+    path(
+        "products/barcode/",
+        views.ProductBarcodeBatchAPIView.as_view(),
+        name="product-barcode-batch",
+    ),
+    path(
+        "products/barcode/<str:barcode>/",
+        views.ProductBarcodeAPIView.as_view(),
+        name="product-barcode",
+    ),
 ]
@@ -1,37 +1,338 @@
 # products/views.py
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django_ratelimit.exceptions import Ratelimited
+from rest_framework.exceptions import APIException, NotFound
 from rest_framework.generics import ListAPIView
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .filters import ProductSearchFilter
+from .cache import (
+    aget_or_compute,
+    barcode_cache_key,
+    get_or_compute,
+    get_search_generation,
+    search_cache_key,
+    suggest_cache_key,
+)
+from .facets import compute_facets, facets_approximate, wants_facets
+from .filters import search_filterset
+from .instrumentation import (
+    finish_timing,
+    is_slow,
+    log_slow_search,
+    metrics,
+    timing_for,
+)
+from .local_cache import local_generation, search_local_cache
+from .memory_index import search_index
 from .models import Product
-from .serializers import ProductSerializer
-from django.utils.decorators import method_decorator
-from django_ratelimit.decorators import ratelimit
+from .normalization import normalize_search_term
+from .pagination import KeysetPagination, apply_ordering, is_ranked
+from .popularity import (
+    is_sampled,
+    record_product_hits,
+    record_term,
+    sampled_term,
+)
+from .ratelimit import ais_limited, ratelimit
+from .rendering import body_response, decode_body, render_body
+from .routers import replicas
+from .serializers import (
+    PRODUCT_LIST_FIELDS,
+    BarcodeBatchSerializer,
+    ProductListEncoder,
+    ProductSerializer,
+    ProductSuggestionSerializer,
+    SuggestQuerySerializer,
+    list_encoder,
+    related_lookup,
+)
+from .search import suggest_names
 
 
-@method_decorator(ratelimit(key='ip', rate='100/hour', block=True), name='dispatch')
+@method_decorator(ratelimit("search"), name="dispatch")
 class ProductAPIView(ListAPIView):
-    queryset = Product.objects.select_related("brand", "category").all()
     serializer_class = ProductSerializer
-    filterset_class = ProductSearchFilter
+
+    @property
+    def filterset_class(self):
+        return search_filterset()
+
+    def get_queryset(self):
+        # Products, or their search documents when PRODUCT_SEARCH_DOCUMENTS
+        # is on
+        return self.filterset_class._meta.model.objects.all()
 
     def list(self, request, *args, **kwargs):
-        cache_key = f"product_search_{request.GET.urlencode()}"
-        cached_data = cache.get(cache_key)
+        term = sampled_term(request.query_params)
+        if term:
+            record_term(term)
+
+        timing = timing_for(request)
+        timing.cache = "local"
+        # Time spent in the cache stage excludes the nested stages of a
+        # recompute on a miss
+        with timing.stage("cache"):
+            generation = local_generation.get()
+            cache_key = search_cache_key(generation, request)
+            rendered = search_local_cache.get(cache_key)
+            if rendered is None:
+                timing.cache = "hit"
+                rendered = get_or_compute(
+                    cache_key,
+                    lambda: self.get_rendered(request, generation),
+                    timeout=settings.PRODUCT_SEARCH_CACHE_TIMEOUT,
+                )
+                search_local_cache.set(cache_key, rendered)
+
+        # The cached body is sent as is; other formats (the browsable API)
+        # still go through DRF's renderers
+        if request.accepted_renderer.format != "json":
+            return finish_timing(request, Response(decode_body(rendered)))
+        return finish_timing(request, body_response(request, rendered))
+
+    def get_rendered(self, request, generation):
+        data = self.get_list_data(request, generation)
+        with timing_for(request).stage("render"):
+            return render_body(data)
+
+    def get_list_data(self, request, generation):
+        timing = timing_for(request)
+        timing.cache = "miss"
+        started = time.perf_counter()
+
+        with timing.stage("filter"):
+            queryset = self.filter_queryset(self.get_queryset())
+            brands, categories = related_lookup.get(generation)
+
+        # Plain dict rows encoded by hand; brand and category come from the
+        # in-process lookup instead of a join, or the rows carry their
+        # pre-rendered payload
+        encoder = list_encoder(queryset.model, brands, categories)
+        fields = encoder.fields
+        if is_ranked(queryset):
+            fields += ("relevance",)
+        rows = queryset.values(*fields)
+
+        page = self.paginate_queryset(rows)
+        if page is None:
+            with timing.stage("serialize"):
+                return encoder.encode_many(rows)
+
+        with timing.stage("serialize"):
+            data = self.get_paginated_response(encoder.encode_many(page)).data
+        if wants_facets(request.query_params):
+            with timing.stage("facets"):
+                data["facets"] = compute_facets(queryset, brands, categories)
+            data["facets_approximate"] = facets_approximate(
+                request.query_params, data["facets"]
+            )
+
+        elapsed = (time.perf_counter() - started) * 1000
+        if is_slow(elapsed):
+            ordered = apply_ordering(rows, is_ranked(rows))
+            log_slow_search(request.query_params, ordered, elapsed)
+        return data
+
+
+class ProductSearchAsyncView(View):
+    """
+    Async twin of ProductAPIView for ASGI deployments. The ratelimit check,
+    cache reads/writes and the search query are awaited, but each still
+    runs in a sync_to_async thread: the ORM and django-redis have no native
+    async I/O. Responses are identical to the DRF view.
+    """
+
+    async def get(self, request):
+        if await ais_limited(request, "search"):
+            raise Ratelimited()
+
+        filterset_class = search_filterset()
+        filterset = filterset_class(
+            request.GET,
+            queryset=filterset_class._meta.model.objects.all(),
+            request=request,
+        )
+        if not filterset.is_valid():
+            return JsonResponse(filterset.errors, status=400)
+
+        term = sampled_term(request.GET)
+        if term:
+            await sync_to_async(record_term)(term)
+
+        timing = timing_for(request)
+        timing.cache = "local"
+        with timing.stage("cache"):
+            generation = await local_generation.aget()
+            cache_key = search_cache_key(generation, request)
+            rendered = search_local_cache.get(cache_key)
+        if rendered is None:
+            timing.cache = "hit"
+            with timing.stage("cache"):
+                try:
+                    rendered = await aget_or_compute(
+                        cache_key,
+                        lambda: self.get_rendered(
+                            request, filterset, generation
+                        ),
+                        timeout=settings.PRODUCT_SEARCH_CACHE_TIMEOUT,
+                    )
+                except APIException as exc:
+                    return JsonResponse(
+                        {"detail": exc.detail}, status=exc.status_code
+                    )
+                search_local_cache.set(cache_key, rendered)
+        return finish_timing(request, body_response(request, rendered))
+
+    async def get_rendered(self, request, filterset, generation):
+        data = await self.get_list_data(request, filterset, generation)
+        with timing_for(request).stage("render"):
+            return render_body(data)
+
+    async def get_list_data(self, request, filterset, generation):
+        timing = timing_for(request)
+        timing.cache = "miss"
+        started = time.perf_counter()
+
+        # Building the filtered queryset is lazy; the queries run in
+        # apaginate_queryset. Both may load the in-process lookups, which
+        # query synchronously
+        with timing.stage("filter"):
+            queryset = await sync_to_async(lambda: filterset.qs)()
+            brands, categories = await sync_to_async(related_lookup.get)(
+                generation
+            )
+        encoder = list_encoder(queryset.model, brands, categories)
+        fields = encoder.fields
+        if is_ranked(queryset):
+            fields += ("relevance",)
+        rows = queryset.values(*fields)
+
+        paginator = KeysetPagination()
+        page = await paginator.apaginate_queryset(rows, request)
+        with timing.stage("serialize"):
+            data = paginator.get_paginated_data(encoder.encode_many(page))
+        if wants_facets(request.GET):
+            with timing.stage("facets"):
+                data["facets"] = await sync_to_async(compute_facets)(
+                    queryset, brands, categories
+                )
+            data["facets_approximate"] = facets_approximate(
+                request.GET, data["facets"]
+            )
+
+        elapsed = (time.perf_counter() - started) * 1000
+        if is_slow(elapsed):
+            ordered = apply_ordering(rows, is_ranked(rows))
+            await sync_to_async(log_slow_search)(request.GET, ordered, elapsed)
+        return data
+
+
+class ProductSearchMetricsView(View):
+    """
+    Search latency histograms, cache hit counts, cache and index sizes and
+    replica lags of this worker process, in the Prometheus text exposition
+    format.
+    """
+
+    def get(self, request):
+        lines = (
+            search_local_cache.render_metrics()
+            + search_index.render_metrics()
+            + replicas.render_metrics()
+        )
+        return HttpResponse(
+            metrics.render() + "\n".join(lines) + "\n",
+            content_type="text/plain; version=0.0.4",
+        )
+
+
+# Called on every keystroke, so its limit is higher than for searches
+@method_decorator(ratelimit("suggest"), name="dispatch")
+class ProductSuggestAPIView(APIView):
+    serializer_class = ProductSuggestionSerializer
+
+    def get(self, request):
+        params = SuggestQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        prefix = normalize_search_term(params.validated_data["q"])
+        limit = params.validated_data["limit"]
+        if not prefix:
+            return Response([])
+
+        cache_key = suggest_cache_key(get_search_generation(), prefix, limit)
+        data = get_or_compute(
+            cache_key,
+            lambda: suggest_names(Product.objects.all(), prefix, limit),
+            timeout=settings.PRODUCT_SEARCH_CACHE_TIMEOUT,
+        )
+        return Response(data)
+
+
+@method_decorator(ratelimit("barcode"), name="dispatch")
+class ProductBarcodeAPIView(APIView):
+    serializer_class = ProductSerializer
+
+    def get(self, request, barcode):
+        product = lookup_barcodes([barcode], get_search_generation())[barcode]
+        if product is None:
+            raise NotFound("No product with this barcode.")
+        if is_sampled():
+            record_product_hits([product])
+        return Response(product)
+
+
+@method_decorator(ratelimit("barcode_batch"), name="dispatch")
+class ProductBarcodeBatchAPIView(APIView):
+    serializer_class = BarcodeBatchSerializer
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        barcodes = list(dict.fromkeys(serializer.validated_data["barcodes"]))
+
+        products = lookup_barcodes(barcodes, get_search_generation())
+        results = [p for p in products.values() if p is not None]
+        # Scans are the demand signal behind Product.popularity
+        if results and is_sampled():
+            record_product_hits(results)
+        return Response({
+            "results": results,
+            "missing": [code for code, p in products.items() if p is None],
+        })
+
 
-        if cached_data:
-            return Response(cached_data)
+def lookup_barcodes(barcodes, generation):
+    """
+    Maps each barcode to its encoded product, or None when there is none.
+    Reads through a per-barcode cache and fetches all the misses with a
+    single WHERE barcode IN (...) query.
+    """
+    keys = {barcode_cache_key(generation, code): code for code in barcodes}
+    found = {keys[key]: value for key, value in cache.get_many(keys).items()}
 
-        queryset = self.filter_queryset(self.get_queryset())
-        page = self.paginate_queryset(queryset)
+    missing = [code for code in barcodes if code not in found]
+    if missing:
+        encoder = ProductListEncoder(*related_lookup.get(generation))
+        rows = Product.objects.filter(barcode__in=missing).values(
+            *PRODUCT_LIST_FIELDS
+        )
+        fetched = {row["barcode"]: encoder.encode(row) for row in rows}
 
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            response = self.get_paginated_response(serializer.data)
-            cache.set(cache_key, response.data, timeout=60*15)
-            return response
+        # Unknown barcodes are cached as False so repeated scans of an
+        # unlisted item don't reach the database either
+        misses = {code: fetched.get(code, False) for code in missing}
+        cache.set_many(
+            {barcode_cache_key(generation, c): v for c, v in misses.items()},
+            timeout=settings.PRODUCT_SEARCH_CACHE_TIMEOUT,
+        )
+        found.update(misses)
 
-        serializer = self.get_serializer(queryset, many=True)
-        cache.set(cache_key, serializer.data, timeout=60*15)
-        return Response(serializer.data)
+    return {code: found[code] or None for code in barcodes}